@@ -1,69 +1,124 @@
 import os
-from groq import Groq
+import time
 import json
+from prometheus_client import Counter, Histogram
+from app.core.llm_providers import LLMProvider, create_provider
+
+# Token deltas are coalesced into one NDJSON frame until it holds this many
+# characters or this much time has passed since the last frame
+CHAT_FRAME_CHARS = int(os.getenv("CHAT_FRAME_CHARS", "48"))
+CHAT_FRAME_MS = float(os.getenv("CHAT_FRAME_MS", "40"))
+
+CHAT_TTFT = Histogram(
+    "chat_time_to_first_token_seconds",
+    "Time from calling the LLM until its first answer token arrived",
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10),
+)
+CHAT_TOKEN_RATE = Histogram(
+    "chat_tokens_per_second",
+    "Answer streaming rate after the first token",
+    buckets=(10, 25, 50, 100, 200, 300, 500, 750, 1000, 2000),
+)
+CHAT_RESPONSES = Counter(
+    "chat_responses_total",
+    "Streamed chat answers by outcome (completed, disconnected, error)",
+    ["outcome"],
+)
+
+
+def _token_frame(parts: list) -> str:
+    return json.dumps({"type": "token", "content": "".join(parts)}) + "\n"
+
 
 class ChatEngine:
-    def __init__(self):
-        # 1. Initialize the Groq Client
-        # It automatically picks up GROQ_API_KEY from the environment variables
-        self.client = Groq()
-        # We use Llama3-8b-8192 which is fast and free on Groq
-        self.model = "llama-3.3-70b-versatile"
+    """
+    Streams answers from the provider picked by LLM_PROVIDER: "groq"
+    (default), "openai" (any OpenAI-compatible server at LLM_BASE_URL) or
+    "fake" (deterministic, for load tests).
+    """
+    def __init__(self, provider_name: str | None = None):
+        self.provider_name = provider_name or os.getenv("LLM_PROVIDER", "groq")
+        self._provider: LLMProvider | None = None
 
+    @property
+    def provider(self) -> LLMProvider:
+        # Built on first use, so importing the app needs no API key and opens no clients
+        if self._provider is None:
+            self._provider = create_provider(self.provider_name)
+        return self._provider
 
-    def generate_streaming_answer(self, query: str, context: str, history: list = [], debug_data: dict = None):
+
+    async def generate_streaming_answer(self, messages: list, debug_data: dict = None, is_disconnected=None):
         """
         Yields JSON strings: First the metadata, then the answer chunks.
+        `messages` is the finished prompt (see app.core.context.build_prompt).
+        `is_disconnected` (e.g. request.is_disconnected) is checked before every
+        frame; once the browser is gone the upstream stream is closed, so the
+        model stops generating and nothing keeps running for a dead client.
         """
+        started = time.perf_counter()
+        first_token_at = None
+        tokens = 0
+        deltas = None
+        # Stays "disconnected" unless we get to the end (break, cancellation or aclose)
+        outcome = "disconnected"
         try:
             # 1. Send Debug Info FIRST (if available)
             if debug_data:
                 yield json.dumps({"type": "debug", "data": debug_data}) + "\n"
 
-            # 2. Setup the AI Request
-            system_prompt = (
-                "You are GuardRail AI. Use the Context to answer. "
-                "If asked for opinions, use general knowledge. "
-                "Context contains <REDACTED> tags for safety."
-            )
-
-            messages = [{"role": "system", "content": system_prompt}]
-            messages.extend(history[-4:]) 
-            user_message = f"Context:\n{context}\n\nQuestion: {query}"
-            messages.append({"role": "user", "content": user_message})
-
-            # 3. Call API
-            stream = self.client.chat.completions.create(
-                messages=messages,
-                model=self.model,
-                temperature=0.2,
-                stream=True,
-            )
-
-            # 4. Yield Chunks
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    # Send text as a JSON event
-                    yield json.dumps({"type": "token", "content": chunk.choices[0].delta.content}) + "\n"
+            # 2. Call API
+            deltas = self.provider.stream_chat(messages, temperature=0.2)
+
+            # 3. Yield Chunks, a few deltas per frame (the first one right away)
+            pending, pending_chars = [], 0
+            last_frame = started
+            async for delta in deltas:
+                now = time.perf_counter()
+                tokens += 1
+                if first_token_at is None:
+                    first_token_at = now
+                    CHAT_TTFT.observe(now - started)
+                pending.append(delta)
+                pending_chars += len(delta)
+
+                if tokens > 1 and pending_chars < CHAT_FRAME_CHARS and (now - last_frame) * 1000 < CHAT_FRAME_MS:
+                    continue
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                yield _token_frame(pending)
+                pending, pending_chars = [], 0
+                last_frame = now
+            else:
+                if pending:
+                    yield _token_frame(pending)
+                outcome = "completed"
 
         except Exception as e:
+            outcome = "error"
             yield json.dumps({"type": "error", "content": str(e)}) + "\n"
 
+        finally:
+            if deltas is not None:
+                # Abandons the upstream request if we stopped early
+                await deltas.aclose()
+            CHAT_RESPONSES.labels(outcome).inc()
+            if first_token_at is not None:
+                streaming_time = time.perf_counter() - first_token_at
+                rate = (tokens - 1) / streaming_time if tokens > 1 and streaming_time > 0 else 0.0
+                if rate:
+                    CHAT_TOKEN_RATE.observe(rate)
+                print(f"--- CHAT: {outcome}, first token after {first_token_at - started:.2f}s, {tokens} tokens at {rate:.0f} tok/s ---")
+
     
-    def transcribe_audio(self, file_path: str) -> str:
+    async def transcribe_audio(self, file_path: str) -> str:
         """
-        Uses Groq's Whisper model to convert Audio -> Text.
+        Uses the provider's Whisper model to convert Audio -> Text.
         """
         try:
             with open(file_path, "rb") as file:
-                transcription = self.client.audio.transcriptions.create(
-                    file=(file_path, file.read()),
-                    model="whisper-large-v3",
-                    response_format="json",
-                    temperature=0.0,
-                    language = "en"
-                )
-            return transcription.text
+                audio = file.read()
+            return await self.provider.transcribe(os.path.basename(file_path), audio)
         except Exception as e:
             return f"Error transcribing audio: {str(e)}"
 
@@ -0,0 +1,117 @@
+import os
+import re
+from typing import NamedTuple
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces, so stay well below it
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+# Words and individual punctuation marks, roughly what a BERT tokenizer splits on
+_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = {".", "!", "?", ";"}
+
+
+class Chunk(NamedTuple):
+    index: int
+    text: str
+    start: int  # character offsets into the source text
+    end: int
+    token_count: int
+
+
+def _piece_tokens(piece: str) -> int:
+    # Long words / numbers get split into several word pieces
+    return 1 + len(piece) // 8
+
+
+def count_tokens(text: str) -> int:
+    """
+    Cheap, slightly pessimistic estimate of the model's token count.
+    Avoids shipping a tokenizer just to size chunks and prompts.
+    """
+    return sum(_piece_tokens(m.group()) for m in _PIECE_RE.finditer(text))
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> list[Chunk]:
+    """
+    Splits text into overlapping chunks of at most `max_tokens` (estimated).
+    Chunks prefer to end on a sentence or line boundary, and each one repeats
+    about `overlap_tokens` from the end of the previous one so facts that
+    straddle a cut are still retrievable.
+    """
+    pieces = list(_PIECE_RE.finditer(text))
+    if not pieces:
+        return []
+
+    weights = [_piece_tokens(p.group()) for p in pieces]
+    # A piece is a boundary if it closes a sentence or the text breaks the line after it
+    boundaries = [
+        p.group() in _SENTENCE_END
+        or (i + 1 < len(pieces) and "\n" in text[p.end():pieces[i + 1].start()])
+        for i, p in enumerate(pieces)
+    ]
+
+    chunks = []
+    start = 0
+    while start < len(pieces):
+        # 1. Grow the window up to the token budget
+        end = start
+        used = 0
+        while end < len(pieces) and (used + weights[end] <= max_tokens or end == start):
+            used += weights[end]
+            end += 1
+
+        # 2. Pull the cut back to the last boundary in the second half of the window
+        if end < len(pieces):
+            for cut in range(end - 1, start + (end - start) // 2, -1):
+                if boundaries[cut]:
+                    end = cut + 1
+                    break
+
+        char_start = pieces[start].start()
+        char_end = pieces[end - 1].end()
+        chunks.append(Chunk(
+            index=len(chunks),
+            text=text[char_start:char_end],
+            start=char_start,
+            end=char_end,
+            token_count=sum(weights[start:end]),
+        ))
+        if end >= len(pieces):
+            break
+
+        # 3. Step back for the overlap, but always make progress
+        next_start = end
+        overlap = 0
+        while next_start > start + 1 and overlap + weights[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += weights[next_start]
+        start = next_start
+
+    return chunks
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    The longest prefix of `text` within `max_tokens` (estimated) that ends on
+    a sentence or line boundary; falls back to a word boundary when the
+    first sentence alone is too long.
+    """
+    pieces = list(_PIECE_RE.finditer(text))
+    used = 0
+    end = 0
+    last_boundary = 0
+    for i, p in enumerate(pieces):
+        used += _piece_tokens(p.group())
+        if used > max_tokens:
+            break
+        end = p.end()
+        if p.group() in _SENTENCE_END or (i + 1 < len(pieces) and "\n" in text[p.end():pieces[i + 1].start()]):
+            last_boundary = end
+    else:
+        return text
+    return text[:last_boundary or end].rstrip()
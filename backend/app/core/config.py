@@ -1,6 +1,14 @@
+import os
 # This key is used to digitally sign the tokens.
 # In production, this would come from an Environment Variable (.env).
 # For now, we will hardcode a random string.
 SECRET_KEY = "guardrail_super_secret_key_change_this_in_prod"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+# all-MiniLM-L6-v2 maps text to a 384-dimensional vector
+EMBEDDING_DIM = 384
+
+# Hugging Face Inference base URL (NER + embeddings). Point it at
+# scripts/mock_hf_server.py for load tests.
+HF_INFERENCE_URL = os.getenv("HF_INFERENCE_URL", "https://router.huggingface.co/hf-inference").rstrip("/")
@@ -0,0 +1,133 @@
+"""
+Prompt assembly for /chat/: decides what goes into the LLM call under a
+fixed token budget, so prompt size (and with it latency, cost and the risk
+of overflowing the model's window) no longer grows with history length or
+document size.
+"""
+import os
+import re
+from typing import NamedTuple
+from app.core.chunker import count_tokens, truncate_to_tokens
+
+# Whole prompt: system + history + retrieved passages + question
+CHAT_PROMPT_TOKENS = int(os.getenv("CHAT_PROMPT_TOKENS", "3000"))
+# At most this share of the budget goes to conversation history (unused share goes to passages)
+CHAT_HISTORY_SHARE = float(os.getenv("CHAT_HISTORY_SHARE", "0.25"))
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "4"))
+# Passages this similar (word-trigram Jaccard) to one already picked are skipped
+CHAT_DEDUP_SIMILARITY = float(os.getenv("CHAT_DEDUP_SIMILARITY", "0.8"))
+# A passage cut shorter than this isn't worth including
+CHAT_MIN_PASSAGE_TOKENS = int(os.getenv("CHAT_MIN_PASSAGE_TOKENS", "40"))
+
+SYSTEM_PROMPT = (
+    "You are GuardRail AI. Use the Context to answer. "
+    "If asked for opinions, use general knowledge. "
+    "Context contains <REDACTED> tags for safety."
+)
+PASSAGE_SEPARATOR = "\n\n---\n\n"
+# Per-message overhead of the chat format (role markers etc.)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class Prompt(NamedTuple):
+    messages: list[dict]
+    context: str
+    usage: dict
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def _is_near_duplicate(shingles: set, picked: list[set], threshold: float) -> bool:
+    for other in picked:
+        union = len(shingles | other)
+        if union and len(shingles & other) / union >= threshold:
+            return True
+    return False
+
+
+def _fit_history(history: list[dict], budget: int) -> tuple[list[dict], int]:
+    """Most recent turns first, as many as fit; an oversized latest turn is cut short."""
+    kept = []
+    used = 0
+    for turn in reversed(history[-CHAT_HISTORY_TURNS:]):
+        content = turn.get("content", "")
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget:
+            room = budget - used - MESSAGE_OVERHEAD_TOKENS
+            if not kept and room >= CHAT_MIN_PASSAGE_TOKENS:
+                content = truncate_to_tokens(content, room)
+                kept.append({"role": turn.get("role", "user"), "content": content})
+                used += count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+            break
+        kept.append({"role": turn.get("role", "user"), "content": content})
+        used += tokens
+    kept.reverse()
+    return kept, used
+
+
+def build_prompt(query: str, passages: list[dict], history: list[dict], budget: int = CHAT_PROMPT_TOKENS) -> Prompt:
+    """
+    Packs a chat prompt into `budget` tokens (estimated with count_tokens).
+
+    1. System prompt and question are always included.
+    2. History gets up to CHAT_HISTORY_SHARE of what's left, newest turns first.
+    3. Passages ({"text", "score", ...}) fill the rest greedily, best score
+       first. Near-duplicates of a passage already taken are skipped, and
+       the passage that no longer fits whole is cut at a sentence boundary.
+    """
+    question = f"\n\nQuestion: {query}"
+    fixed = count_tokens(SYSTEM_PROMPT) + count_tokens("Context:\n" + question) + 2 * MESSAGE_OVERHEAD_TOKENS
+    remaining = max(0, budget - fixed)
+
+    history_messages, history_tokens = _fit_history(history, int(remaining * CHAT_HISTORY_SHARE))
+    remaining -= history_tokens
+
+    picked_texts, picked_shingles = [], []
+    duplicates = truncated = dropped = 0
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR)
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        text = passage["text"]
+        shingles = _shingles(text)
+        if _is_near_duplicate(shingles, picked_shingles, CHAT_DEDUP_SIMILARITY):
+            duplicates += 1
+            continue
+
+        room = remaining - (separator_tokens if picked_texts else 0)
+        tokens = count_tokens(text)
+        if tokens > room:
+            if room < CHAT_MIN_PASSAGE_TOKENS:
+                dropped += 1
+                continue
+            text = truncate_to_tokens(text, room)
+            tokens = count_tokens(text)
+            truncated += 1
+
+        picked_texts.append(text)
+        picked_shingles.append(shingles)
+        remaining = room - tokens
+
+    context = PASSAGE_SEPARATOR.join(picked_texts)
+    context_tokens = count_tokens(context)
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages.extend(history_messages)
+    messages.append({"role": "user", "content": f"Context:\n{context}{question}"})
+
+    usage = {
+        "budget": budget,
+        "total": fixed + history_tokens + context_tokens,
+        "history": history_tokens,
+        "history_turns": len(history_messages),
+        "context": context_tokens,
+        "passages_used": len(picked_texts),
+        "passages_truncated": truncated,
+        "passages_dropped": dropped,
+        "duplicates_skipped": duplicates,
+    }
+    return Prompt(messages, context, usage)
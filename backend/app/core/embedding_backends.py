@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from app.core.config import EMBEDDING_DIM, HF_INFERENCE_URL
+from app.core.chunker import count_tokens
+from app.core.http import post_json
+from app.core.resilience import call_with_retry, get_breaker, UpstreamUnavailable
+
+# Remote batching knobs: items per request, estimated tokens per request, requests in flight
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "4096"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+
+# Local micro-batching knobs: max texts per forward pass, max wait to fill one
+LOCAL_EMBED_MAX_BATCH = int(os.getenv("LOCAL_EMBED_MAX_BATCH", "64"))
+LOCAL_EMBED_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBED_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingBackend:
+    """
+    Turns a list of texts into a (len(texts), 384) float32 matrix.
+    `embed` returns (vectors, errors) where errors maps index -> reason.
+    """
+    model_name: str
+
+    async def embed(self, texts: list[str]) -> tuple[np.ndarray, dict[int, str]]:
+        raise NotImplementedError
+
+
+class RemoteHFBackend(EmbeddingBackend):
+    """Hugging Face serverless feature-extraction pipeline over HTTPS."""
+
+    def __init__(self):
+        self.hf_token = os.getenv("HF_TOKEN")
+        self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        # THE FIX: The official pipeline URL announced by the Hugging Face maintainers
+        self.api_url = f"{HF_INFERENCE_URL}/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction"
+        self.headers = {"Authorization": f"Bearer {self.hf_token}"}
+        self.breaker = get_breaker("hf-embeddings")
+        print("--- RAG: Configured for Official HF Feature Extraction ---")
+
+    async def embed(self, texts):
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        errors: dict[int, str] = {}
+
+        if not self.hf_token:
+            return vectors, {i: "HF_TOKEN is not configured" for i in range(len(texts))}
+
+        # At most EMBED_MAX_CONCURRENCY batches in flight, results kept in input order
+        limit = asyncio.Semaphore(EMBED_MAX_CONCURRENCY)
+
+        async def run(batch):
+            async with limit:
+                return await self._embed_batch([texts[i] for i in batch])
+
+        batches = self._make_batches(texts)
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        for batch, (batch_vectors, batch_errors) in zip(batches, results):
+            for offset, index in enumerate(batch):
+                if offset in batch_errors:
+                    errors[index] = batch_errors[offset]
+                else:
+                    vectors[index] = batch_vectors[offset]
+
+        return vectors, errors
+
+    def _make_batches(self, texts: list[str]) -> list[list[int]]:
+        """Greedy packing of input indexes, preserving order."""
+        batches = []
+        current = []
+        current_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text)
+            if current and (len(current) >= EMBED_BATCH_SIZE or current_tokens + tokens > EMBED_BATCH_TOKENS):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _embed_batch(self, texts: list[str]):
+        """
+        Returns (vectors, errors) for one batch, errors keyed by position.
+        If the whole request is rejected, items are retried one by one so a
+        single bad input doesn't fail its neighbours.
+        """
+        try:
+            return await self._post(texts), {}
+        except UpstreamUnavailable as e:
+            # The service itself is down; retrying items one by one won't help
+            return [], {i: str(e) for i in range(len(texts))}
+        except Exception as e:
+            if len(texts) == 1:
+                return [], {0: str(e)}
+
+        vectors = [None] * len(texts)
+        errors = {}
+        for i, text in enumerate(texts):
+            try:
+                vectors[i] = (await self._post([text]))[0]
+            except Exception as e:
+                errors[i] = str(e)
+        return vectors, errors
+
+    async def _post(self, texts: list[str]) -> list[list[float]]:
+        # The pipeline takes a list of inputs and returns one vector per input
+        payload = {"inputs": texts}
+
+        # Cold-start 503s are retried with backoff; an open circuit fails fast
+        response = await call_with_retry(
+            self.breaker,
+            lambda: post_json(self.api_url, payload, headers=self.headers, timeout=15),
+        )
+
+        if response.status_code != 200:
+            raise RuntimeError(f"RAG API Error ({response.status_code}): {response.text}")
+
+        # The API returns a nested list: [[0.1, 0.2, ...], ...]
+        result = response.json()
+        if not isinstance(result, list) or len(result) != len(texts):
+            raise RuntimeError(f"RAG API returned {type(result).__name__} for {len(texts)} inputs")
+        for vector in result:
+            if not isinstance(vector, list) or len(vector) != EMBEDDING_DIM:
+                raise RuntimeError("RAG API returned a vector of the wrong shape")
+        return result
+
+
+class LocalBackend(EmbeddingBackend):
+    """
+    all-MiniLM-L6-v2 on the local CPU via sentence-transformers (optionally
+    its ONNX runtime). The model is loaded on first use so worker startup
+    stays fast.
+
+    Concurrent callers are coalesced by a micro-batching queue: a single
+    background thread drains whatever requests arrived within
+    LOCAL_EMBED_MAX_WAIT_MS (up to LOCAL_EMBED_MAX_BATCH texts) and runs
+    them through one forward pass.
+    """
+
+    def __init__(self):
+        self.model_name = os.getenv("LOCAL_EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+        # "torch" or "onnx"
+        self.runtime = os.getenv("LOCAL_EMBED_RUNTIME", "onnx")
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._requests: "queue.Queue[tuple[list[str], Future]]" = queue.Queue()
+        self._worker = None
+        print(f"--- RAG: Configured for local {self.runtime} embeddings ({self.model_name}) ---")
+
+    async def embed(self, texts):
+        if not texts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32), {}
+
+        self._ensure_worker()
+        future: Future = Future()
+        self._requests.put((texts, future))
+        try:
+            # Await the micro-batcher without blocking the event loop
+            return await asyncio.wrap_future(future), {}
+        except Exception as e:
+            vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+            return vectors, {i: f"Local embedding failed: {e}" for i in range(len(texts))}
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._load_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-microbatcher", daemon=True)
+                self._worker.start()
+
+    def _load_model(self):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=local requires the sentence-transformers package") from e
+
+        print("--- RAG: Loading AI Model (this happens once)... ---")
+        if self.runtime == "onnx":
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+        else:
+            model = SentenceTransformer(self.model_name, device="cpu")
+        print("--- RAG: Model Loaded. ---")
+        return model
+
+    def _run(self):
+        while True:
+            # 1. Block for the first request, then gather more for a few ms
+            pending = [self._requests.get()]
+            size = len(pending[0][0])
+            deadline = time.monotonic() + LOCAL_EMBED_MAX_WAIT_MS / 1000
+            while size < LOCAL_EMBED_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            # 2. One forward pass for everyone, then hand each caller its rows
+            try:
+                if self._model is None:
+                    self._model = self._load_model()
+                all_texts = [text for texts, _ in pending for text in texts]
+                matrix = self._model.encode(
+                    all_texts,
+                    batch_size=LOCAL_EMBED_MAX_BATCH,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                ).astype(np.float32, copy=False)
+
+                offset = 0
+                for texts, future in pending:
+                    future.set_result(matrix[offset:offset + len(texts)])
+                    offset += len(texts)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Deterministic feature-hashing embedder for tests and load tests.
+    No model, no network: words and word bigrams are hashed into 384
+    signed buckets and L2-normalized, so overlapping texts still score high.
+    """
+
+    _WORD_RE = re.compile(r"\w+")
+
+    def __init__(self):
+        self.model_name = "hashing-384"
+        print("--- RAG: Configured for deterministic hashing embeddings ---")
+
+    async def embed(self, texts):
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = self._WORD_RE.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors, {}
+
+
+BACKENDS = {
+    "remote": RemoteHFBackend,
+    "local": LocalBackend,
+    "hashing": HashingBackend,
+}
+
+
+def create_backend(name: str) -> EmbeddingBackend:
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}', expected one of {sorted(BACKENDS)}")
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+from prometheus_client import Counter
+from app.core.config import EMBEDDING_DIM
+
+CACHE_LOOKUPS = Counter(
+    "embedding_cache_lookups_total",
+    "Embedding cache lookups by outcome (memory hit, disk hit or miss)",
+    ["result"],
+)
+CACHE_SAVED_SECONDS = Counter(
+    "embedding_cache_saved_seconds_total",
+    "Estimated embedding API time avoided by cache hits",
+)
+
+
+def normalize_text(text: str) -> str:
+    # Whitespace never changes the tokens the model sees
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache in front of the embedding engine.
+
+    Keys are sha256(model name + normalized text), so re-uploads, repeated
+    boilerplate chunks and repeated questions are embedded once. There is an
+    in-memory LRU tier and, when `disk_path` is set, a SQLite tier holding
+    raw float32 blobs that survives restarts. SQLite calls run in a thread,
+    one round trip per batch, so they never block the event loop.
+    """
+
+    def __init__(self, model_name: str, max_items: int, disk_path: str | None = None):
+        self.model_name = model_name
+        self.max_items = max_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        # The SQLite connection is shared by worker threads, one call at a time
+        self._disk_lock = threading.Lock()
+        # Running average of API seconds per item, used to estimate savings
+        self._seconds_per_item = 0.0
+
+        self._disk = None
+        if disk_path:
+            os.makedirs(os.path.dirname(disk_path) or ".", exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._disk.commit()
+            print(f"--- RAG: Embedding cache persisted at {disk_path} ---")
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    async def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """Returns the cached vectors for whichever keys are present."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+        memory_hits = len(found)
+
+        missing = [key for key in keys if key not in found]
+        if missing and self._disk is not None:
+            disk_found = await asyncio.to_thread(self._disk_get, missing)
+            with self._lock:
+                for key, vector in disk_found.items():
+                    self._remember(key, vector)
+            found.update(disk_found)
+
+        disk_hits = len(found) - memory_hits
+        CACHE_LOOKUPS.labels("memory").inc(memory_hits)
+        CACHE_LOOKUPS.labels("disk").inc(disk_hits)
+        CACHE_LOOKUPS.labels("miss").inc(len(keys) - len(found))
+        CACHE_SAVED_SECONDS.inc(len(found) * self._seconds_per_item)
+        return found
+
+    async def put_many(self, items: dict[str, np.ndarray]):
+        if not items:
+            return
+        items = {key: np.asarray(vector, dtype=np.float32) for key, vector in items.items()}
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_put, items)
+
+    def _disk_get(self, keys: list[str]) -> dict[str, np.ndarray]:
+        found = {}
+        placeholders = ",".join("?" * len(keys))
+        with self._disk_lock:
+            rows = self._disk.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        for key, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if vector.shape == (EMBEDDING_DIM,):
+                found[key] = vector
+        return found
+
+    def _disk_put(self, items: dict[str, np.ndarray]):
+        with self._disk_lock:
+            self._disk.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, vector.tobytes()) for key, vector in items.items()],
+            )
+            self._disk.commit()
+
+    def record_latency(self, seconds: float, items: int):
+        """Feeds the per-item API latency estimate (exponential moving average)."""
+        if items <= 0:
+            return
+        per_item = seconds / items
+        if self._seconds_per_item == 0:
+            self._seconds_per_item = per_item
+        else:
+            self._seconds_per_item = 0.9 * self._seconds_per_item + 0.1 * per_item
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
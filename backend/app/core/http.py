@@ -0,0 +1,87 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+
+# Pool shared by every inference call (NER, embeddings, ...)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Requests allowed in flight against any single upstream host
+HTTP_PER_HOST_CONCURRENCY = int(os.getenv("HTTP_PER_HOST_CONCURRENCY", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+
+_client: httpx.AsyncClient | None = None
+_client_loop = None
+_host_limits: dict[str, asyncio.Semaphore] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide AsyncClient, creating it on first use.
+    Connections are pooled and kept alive, so calls skip the TLS handshake.
+    A client is bound to its event loop, so a new loop gets a new client.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(15, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        _client_loop = loop
+        _host_limits.clear()
+    return _client
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_CONCURRENCY)
+    return _host_limits[host]
+
+
+async def post_json(url: str, payload, headers: dict | None = None, timeout: float | None = None) -> httpx.Response:
+    """POSTs JSON through the shared pool, respecting the per-host limit."""
+    client = get_http_client()
+    async with _host_limit(url):
+        return await client.post(
+            url,
+            json=payload,
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT,
+        )
+
+
+@asynccontextmanager
+async def stream_post_json(url: str, payload, headers: dict | None = None, timeout: float | None = None):
+    """
+    Like post_json, but yields the response before its body is read (for
+    server-sent events). Leaving the block closes the connection, which is
+    how a caller abandons a stream early.
+    Streams live for seconds, so they don't take a per-host slot; the
+    server on the other end queues them itself.
+    """
+    client = get_http_client()
+    async with client.stream(
+        "POST",
+        url,
+        json=payload,
+        headers=headers,
+        timeout=httpx.Timeout(timeout, connect=HTTP_CONNECT_TIMEOUT) if timeout else httpx.USE_CLIENT_DEFAULT,
+    ) as response:
+        yield response
+
+
+async def close_http_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+    _host_limits.clear()
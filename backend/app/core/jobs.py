@@ -0,0 +1,208 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_
+from sqlmodel import select
+from app.models import Document, ProcessingJob
+
+# A running job must be heartbeated within this window or it's considered orphaned
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Retry backoff: base * 2^(attempt-1) seconds
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+
+# Set when a job is enqueued in this process, so an embedded worker wakes up
+# immediately instead of waiting for its next poll
+_wakeup: asyncio.Event | None = None
+
+
+def wakeup_event() -> asyncio.Event:
+    global _wakeup
+    if _wakeup is None:
+        _wakeup = asyncio.Event()
+    return _wakeup
+
+
+def enqueue(session, document_id: uuid.UUID, file_path: str) -> ProcessingJob:
+    """
+    Adds a job to the session. The caller commits (so the document row and
+    its job are written in the same transaction) and then calls notify().
+    """
+    job = ProcessingJob(document_id=document_id, file_path=file_path, max_attempts=JOB_MAX_ATTEMPTS)
+    session.add(job)
+    return job
+
+
+def notify():
+    """Wakes an idle in-process worker. Call after the enqueueing commit, or it finds nothing."""
+    wakeup_event().set()
+
+
+async def claim(session_factory, worker_id: str) -> ProcessingJob | None:
+    """
+    Leases the oldest runnable job to `worker_id`, or returns None.
+
+    On Postgres the candidate row is picked with FOR UPDATE SKIP LOCKED, so
+    concurrent workers never block on (or double-claim) the same job. The
+    conditional UPDATE keeps SQLite (which ignores FOR UPDATE) safe too.
+    """
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        candidate = await session.exec(
+            select(ProcessingJob.id)
+            .where(ProcessingJob.status == "queued", ProcessingJob.run_after <= now)
+            .order_by(ProcessingJob.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job_id = candidate.first()
+        if job_id is None:
+            return None
+
+        result = await session.exec(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id, ProcessingJob.status == "queued")
+            .values(
+                status="running",
+                locked_by=worker_id,
+                lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                attempts=ProcessingJob.attempts + 1,
+                updated_at=now,
+            )
+        )
+        await session.commit()
+        if result.rowcount != 1:
+            # Another worker got there first
+            return None
+        return await session.get(ProcessingJob, job_id)
+
+
+async def heartbeat(session_factory, job_id: uuid.UUID, worker_id: str) -> bool:
+    """Extends the lease. Returns False if the job is no longer ours."""
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        result = await session.exec(
+            update(ProcessingJob)
+            .where(
+                ProcessingJob.id == job_id,
+                ProcessingJob.locked_by == worker_id,
+                ProcessingJob.status == "running",
+            )
+            .values(lease_expires_at=now + timedelta(seconds=JOB_LEASE_SECONDS), updated_at=now)
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def complete(session_factory, job_id: uuid.UUID, worker_id: str):
+    async with session_factory() as session:
+        await session.exec(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job_id, ProcessingJob.locked_by == worker_id)
+            .values(status="done", locked_by=None, lease_expires_at=None, updated_at=datetime.utcnow())
+        )
+        await session.commit()
+
+
+async def fail(session_factory, job: ProcessingJob, worker_id: str, error: str):
+    """
+    Puts the job back in the queue with exponential backoff, or gives up
+    (and marks the document failed) once it has used all its attempts.
+    """
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BASE_SECONDS * (2 ** (job.attempts - 1))
+            values = dict(status="queued", run_after=now + timedelta(seconds=delay))
+            print(f"--- JOBS: {job.id} attempt {job.attempts}/{job.max_attempts} failed ({error}), retrying in {delay:.0f}s ---")
+        else:
+            values = dict(status="failed")
+            await _mark_document_failed(session, [job.document_id])
+            print(f"--- JOBS: {job.id} failed permanently after {job.attempts} attempts ({error}) ---")
+
+        await session.exec(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job.id, ProcessingJob.locked_by == worker_id)
+            .values(locked_by=None, lease_expires_at=None, last_error=error[:2000], updated_at=now, **values)
+        )
+        await session.commit()
+
+
+async def release(session_factory, job: ProcessingJob, worker_id: str):
+    """Hands a job back untouched (worker shutting down); the attempt isn't counted."""
+    async with session_factory() as session:
+        await session.exec(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == job.id, ProcessingJob.locked_by == worker_id)
+            .values(
+                status="queued",
+                attempts=ProcessingJob.attempts - 1,
+                locked_by=None,
+                lease_expires_at=None,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        await session.commit()
+
+
+async def recover_orphans(session_factory) -> int:
+    """
+    Requeues running jobs whose lease ran out (their worker died) or fails
+    them if they're out of attempts. Also enqueues documents stuck in
+    "processing" with no job at all, left over from the old in-process
+    background tasks. Safe to run from several workers at once.
+    """
+    now = datetime.utcnow()
+    async with session_factory() as session:
+        expired = ProcessingJob.status == "running", ProcessingJob.lease_expires_at < now
+
+        # 1. Out of attempts: give up on the job and its document
+        dead = (await session.exec(
+            select(ProcessingJob.document_id).where(*expired, ProcessingJob.attempts >= ProcessingJob.max_attempts)
+        )).all()
+        if dead:
+            await session.exec(
+                update(ProcessingJob)
+                .where(*expired, ProcessingJob.attempts >= ProcessingJob.max_attempts)
+                .values(status="failed", locked_by=None, lease_expires_at=None,
+                        last_error="lease expired", updated_at=now)
+            )
+            await _mark_document_failed(session, dead)
+
+        # 2. Everything else goes back to the queue
+        requeued = await session.exec(
+            update(ProcessingJob)
+            .where(*expired)
+            .values(status="queued", locked_by=None, lease_expires_at=None,
+                    last_error="lease expired", run_after=now, updated_at=now)
+        )
+
+        # 3. Documents from before the job table existed
+        has_job = select(ProcessingJob.id).where(
+            ProcessingJob.document_id == Document.id,
+            or_(ProcessingJob.status == "queued", ProcessingJob.status == "running"),
+        ).exists()
+        # (row locks make a concurrently recovering worker skip these instead of double-enqueueing)
+        stranded = (await session.exec(
+            select(Document.id, Document.file_path)
+            .where(Document.status == "processing", ~has_job)
+            .with_for_update(skip_locked=True)
+        )).all()
+        for document_id, file_path in stranded:
+            enqueue(session, document_id, file_path)
+
+        await session.commit()
+
+    recovered = len(dead) + requeued.rowcount + len(stranded)
+    if recovered:
+        print(f"--- JOBS: Recovered {requeued.rowcount} orphaned, {len(dead)} dead, {len(stranded)} stranded ---")
+    return recovered
+
+
+async def _mark_document_failed(session, document_ids):
+    await session.exec(
+        update(Document)
+        .where(Document.id.in_(document_ids), Document.status == "processing")
+        .values(status="failed")
+    )
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import AsyncIterator
+from app.core.http import get_http_client, stream_post_json
+
+# Fake provider knobs: delay before the first token, streaming rate, answer length
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "120"))
+
+
+class LLMProvider:
+    """
+    Chat completion + speech-to-text.
+    `stream_chat` is an async generator of text deltas; closing it early
+    (aclose, or breaking out of `async for`) abandons the upstream request.
+    """
+    model_name: str
+
+    def stream_chat(self, messages: list[dict], temperature: float = 0.2) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def transcribe(self, filename: str, audio: bytes) -> str:
+        raise NotImplementedError
+
+
+class GroqProvider(LLMProvider):
+    """Groq's hosted inference (needs GROQ_API_KEY)."""
+
+    def __init__(self):
+        from groq import AsyncGroq
+        # It automatically picks up GROQ_API_KEY from the environment variables
+        self.client = AsyncGroq()
+        self.model_name = os.getenv("LLM_MODEL") or "llama-3.3-70b-versatile"
+        self.transcribe_model = os.getenv("LLM_TRANSCRIBE_MODEL") or "whisper-large-v3"
+        print(f"--- CHAT: Configured for Groq ({self.model_name}) ---")
+
+    async def stream_chat(self, messages, temperature=0.2):
+        stream = await self.client.chat.completions.create(
+            messages=messages,
+            model=self.model_name,
+            temperature=temperature,
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Closes the HTTP response, which is what makes Groq stop generating
+            await stream.close()
+
+    async def transcribe(self, filename, audio):
+        transcription = await self.client.audio.transcriptions.create(
+            file=(filename, audio),
+            model=self.transcribe_model,
+            response_format="json",
+            temperature=0.0,
+            language="en",
+        )
+        return transcription.text
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Any server speaking the OpenAI /v1/chat/completions API (vLLM,
+    llama.cpp, Ollama, scripts/mock_llm_server.py, ...) at LLM_BASE_URL.
+    """
+
+    def __init__(self):
+        self.base_url = (os.getenv("LLM_BASE_URL") or "http://localhost:8001/v1").rstrip("/")
+        self.model_name = os.getenv("LLM_MODEL") or "llama-3.3-70b-versatile"
+        self.transcribe_model = os.getenv("LLM_TRANSCRIBE_MODEL") or "whisper-large-v3"
+        api_key = os.getenv("LLM_API_KEY")
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        print(f"--- CHAT: Configured for OpenAI-compatible server at {self.base_url} ({self.model_name}) ---")
+
+    async def stream_chat(self, messages, temperature=0.2):
+        payload = {"model": self.model_name, "messages": messages, "temperature": temperature, "stream": True}
+        async with stream_post_json(f"{self.base_url}/chat/completions", payload, headers=self.headers, timeout=60) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"LLM API Error ({response.status_code}): {(await response.aread()).decode(errors='replace')}")
+
+            # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+
+    async def transcribe(self, filename, audio):
+        response = await get_http_client().post(
+            f"{self.base_url}/audio/transcriptions",
+            data={"model": self.transcribe_model, "response_format": "json", "language": "en"},
+            files={"file": (filename, audio)},
+            headers=self.headers,
+            timeout=60,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"LLM API Error ({response.status_code}): {response.text}")
+        return response.json()["text"]
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic stand-in for load tests: no network, no quota. Waits
+    FAKE_LLM_LATENCY_MS, then streams FAKE_LLM_TOKENS words at
+    FAKE_LLM_TOKENS_PER_SECOND. The same prompt always gets the same answer.
+    """
+
+    _WORDS = (
+        "the invoice total is listed under payment details and the document "
+        "mentions a billing address with redacted personal data for this customer"
+    ).split()
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS,
+                 tokens_per_second: float = FAKE_LLM_TOKENS_PER_SECOND, tokens: int = FAKE_LLM_TOKENS):
+        self.model_name = "fake"
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.tokens = tokens
+        print(f"--- CHAT: Configured for fake LLM ({latency_ms:.0f} ms to first token, {tokens_per_second:.0f} tok/s) ---")
+
+    def answer(self, messages: list[dict]) -> list[str]:
+        seed = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode("utf-8"), digest_size=8).digest()
+        start = int.from_bytes(seed, "little")
+        return [
+            ("" if i == 0 else " ") + self._WORDS[(start + i * 7) % len(self._WORDS)]
+            for i in range(self.tokens)
+        ]
+
+    async def stream_chat(self, messages, temperature=0.2):
+        # Sleep to an absolute schedule so the rate doesn't drift under load
+        started = time.monotonic()
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for i, token in enumerate(self.answer(messages)):
+            delay = started + self.latency_ms / 1000 + i * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield token
+
+    async def transcribe(self, filename, audio):
+        await asyncio.sleep(self.latency_ms / 1000)
+        return f"fake transcription of {len(audio)} bytes"
+
+
+PROVIDERS = {
+    "groq": GroqProvider,
+    "openai": OpenAICompatibleProvider,
+    "fake": FakeProvider,
+}
+
+
+def create_provider(name: str) -> LLMProvider:
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown LLM_PROVIDER '{name}', expected one of {sorted(PROVIDERS)}")
@@ -1,78 +1,140 @@
 import os
-import requests
 import re
-import time
+import asyncio
+from app.core.config import HF_INFERENCE_URL
+from app.core.http import post_json
+from app.core.pii import Span, default_detector, resolve_overlaps, apply_spans
+from app.core.resilience import call_with_retry, get_breaker, UpstreamUnavailable
+
+# bert-base-NER sees at most 512 word pieces, so long text is sent in windows
+NER_WINDOW_CHARS = int(os.getenv("NER_WINDOW_CHARS", "1500"))
+NER_WINDOW_OVERLAP_CHARS = int(os.getenv("NER_WINDOW_OVERLAP_CHARS", "200"))
+NER_MAX_CONCURRENT_WINDOWS = int(os.getenv("NER_MAX_CONCURRENT_WINDOWS", "4"))
+
+_SENTENCE_BREAK_RE = re.compile(r"[.!?]\s+|\n")
+
+
+def split_windows(text: str, size: int = NER_WINDOW_CHARS, overlap: int = NER_WINDOW_OVERLAP_CHARS) -> list[tuple[int, int]]:
+    """
+    Cuts text into overlapping (start, end) windows of at most `size`
+    characters. Windows end on a sentence/line break when one exists in their
+    second half (else on whitespace), and the next window starts `overlap`
+    characters earlier on a whitespace boundary, so no entity is only ever
+    seen cut in half.
+    """
+    windows = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            floor = start + size // 2
+            breaks = [m.end() for m in _SENTENCE_BREAK_RE.finditer(text, floor, end)]
+            if breaks:
+                end = breaks[-1]
+            else:
+                space = text.rfind(" ", floor, end)
+                if space > 0:
+                    end = space + 1
+        windows.append((start, end))
+        if end >= len(text):
+            break
+
+        # Step back for the overlap, then forward to the next word start
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return windows
+
+
+def merge_spans(spans: list[tuple[int, int, str]]) -> list[tuple[int, int, str]]:
+    """
+    Dedupes entity spans found in overlapping windows. Overlapping spans with
+    the same label are unioned (an entity cut at a window edge is completed
+    by the next window); with different labels the longer one wins.
+    """
+    merged: list[tuple[int, int, str]] = []
+    for start, end, label in sorted(spans, key=lambda s: (s[0], -s[1])):
+        if merged and start < merged[-1][1]:
+            prev_start, prev_end, prev_label = merged[-1]
+            if label == prev_label:
+                merged[-1] = (prev_start, max(prev_end, end), label)
+            elif end - start > prev_end - prev_start:
+                merged[-1] = (start, end, label)
+            continue
+        merged.append((start, end, label))
+    return merged
+
 
 class NERRedactor:
     def __init__(self):
         self.hf_token = os.getenv("HF_TOKEN")
-        self.api_url = "https://router.huggingface.co/hf-inference/models/dslim/bert-base-NER"
+        self.api_url = f"{HF_INFERENCE_URL}/models/dslim/bert-base-NER"
         self.headers = {"Authorization": f"Bearer {self.hf_token}"}
+        self.breaker = get_breaker("hf-ner")
         print("--- NER: Configured for Hugging Face Cloud Inference ---")
 
-    def redact(self, text: str):
+    async def redact(self, text: str):
         # Added URL to the stats tracker
         stats = {"PER": 0, "ORG": 0, "LOC": 0, "SSN": 0, "CREDIT_CARD": 0, "EMAIL": 0, "URL": 0}
         
-        # We process the first 2500 characters to capture more of the resume
-        safe_text = text[:2500] 
-
+        # The whole document is redacted: it's split into overlapping windows
+        # that go to the model concurrently, then merged back into one set of spans
         spans_to_redact = []
-        if self.hf_token:
-            try:
-                payload = {
-                    "inputs": safe_text, 
-                    "parameters": {"aggregation_strategy": "simple"}
-                }
-                response = requests.post(self.api_url, headers=self.headers, json=payload, timeout=20)
-                
-                if response.status_code == 503:
-                    print("NER: Model loading, waiting 5s...")
-                    time.sleep(5)
-                    return self.redact(text)
-
-                if response.status_code == 200:
-                    ner_results = response.json()
-                    for entity in ner_results:
-                        label = entity.get('entity_group', entity.get('entity', ''))
-                        label = label.replace('B-', '').replace('I-', '')
-                        
-                        if label in ['PER', 'ORG', 'LOC']:
-                            spans_to_redact.append((entity['start'], entity['end'], label))
-                            stats[label] += 1
-                else:
-                    print(f"NER API Error: {response.status_code} - {response.text}")
-            except Exception as e:
-                print(f"NER Request Failed: {e}")
-
-        spans_to_redact.sort(key=lambda x: x[0], reverse=True)
-        
-        redacted_text = list(safe_text)
-        for start, end, label in spans_to_redact:
-            redacted_text[start:end] = f"<{label}>"
-        
-        final_text = "".join(redacted_text)
+        if self.hf_token and text:
+            limit = asyncio.Semaphore(NER_MAX_CONCURRENT_WINDOWS)
 
-        # 1. OCR-Proof Email Fallback (Catches spaces before/after @)
-        email_pattern = r'[a-zA-Z0-9._%+-]+\s*@\s*[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-        stats["EMAIL"] += len(re.findall(email_pattern, final_text))
-        final_text = re.sub(email_pattern, "<EMAIL>", final_text)
-        
-        # 2. URL Fallback (Catches GitHub, LinkedIn, etc.)
-        url_pattern = r'(?:https?://)?(?:www\.)?(?:linkedin\.com|github\.com)\S+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}/\S+'
-        stats["URL"] += len(re.findall(url_pattern, final_text))
-        final_text = re.sub(url_pattern, "<URL>", final_text)
+            async def run(window):
+                async with limit:
+                    return await self._detect_window(text, *window)
 
-        # 3. Standard SSN / Credit Card Fallbacks
-        ssn_pattern = r'\b\d{3}-\d{2}-\d{4}\b'
-        cc_pattern = r'\b(?:\d[ -]*?){13,16}\b'
+            results = await asyncio.gather(*(run(w) for w in split_windows(text)))
+            spans_to_redact = merge_spans([span for window_spans in results for span in window_spans])
 
-        stats["SSN"] += len(re.findall(ssn_pattern, final_text))
-        final_text = re.sub(ssn_pattern, "<SSN>", final_text)
-        
-        stats["CREDIT_CARD"] += len(re.findall(cc_pattern, final_text))
-        final_text = re.sub(cc_pattern, "<CREDIT_CARD>", final_text)
+        # One compiled pass for emails / URLs / SSNs / cards over the original
+        # text, then NER + regex spans are merged (structured PII wins overlaps)
+        # and the output is built with a single join
+        spans = resolve_overlaps(
+            [Span(*span) for span in spans_to_redact] + default_detector.find(text)
+        )
+        final_text, counts = apply_spans(text, spans)
+        stats.update(counts)
         
         return final_text, stats
 
+    async def _detect_window(self, text: str, start: int, end: int) -> list[tuple[int, int, str]]:
+        """
+        Runs the model over text[start:end] and returns PER/ORG/LOC spans in
+        document coordinates. A failed window yields no spans (the regex pass
+        still runs over it).
+        """
+        try:
+            payload = {
+                "inputs": text[start:end], 
+                "parameters": {"aggregation_strategy": "simple"}
+            }
+            # Cold-start 503s are retried with backoff; an open circuit fails fast
+            response = await call_with_retry(
+                self.breaker,
+                lambda: post_json(self.api_url, payload, headers=self.headers, timeout=20),
+            )
+
+            if response.status_code != 200:
+                print(f"NER API Error: {response.status_code} - {response.text}")
+                return []
+
+            spans = []
+            for entity in response.json():
+                label = entity.get('entity_group', entity.get('entity', ''))
+                label = label.replace('B-', '').replace('I-', '')
+                
+                if label in ['PER', 'ORG', 'LOC']:
+                    spans.append((start + entity['start'], start + entity['end'], label))
+            return spans
+        except UpstreamUnavailable as e:
+            # Degrade to the regex-only path instead of failing the document
+            print(f"NER Unavailable, using regex-only redaction: {e}")
+        except Exception as e:
+            print(f"NER Request Failed: {e}")
+        return []
+
 ner_redactor = NERRedactor()
\ No newline at end of file
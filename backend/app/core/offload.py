@@ -0,0 +1,154 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from prometheus_client import Gauge, Histogram
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Processes for CPU-bound work (pdfplumber, poppler, tesseract). 0 = run in a thread instead.
+OFFLOAD_POOL_SIZE = int(os.getenv("OFFLOAD_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+# Per-task deadline, counted from when a process is free to take it
+OFFLOAD_TIMEOUT_SECONDS = float(os.getenv("OFFLOAD_TIMEOUT_SECONDS", "600"))
+# Address-space ceiling per pool process (0 = unlimited)
+OFFLOAD_MEMORY_LIMIT_MB = int(os.getenv("OFFLOAD_MEMORY_LIMIT_MB", "2048"))
+# Recycle processes now and then so leaks from C libraries don't pile up
+OFFLOAD_TASKS_PER_CHILD = int(os.getenv("OFFLOAD_TASKS_PER_CHILD", "50"))
+
+_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+QUEUE_WAIT = Histogram(
+    "offload_queue_wait_seconds",
+    "Time from submission until a pool process started the task (backpressure + spawn)",
+    ["task"],
+    buckets=_BUCKETS,
+)
+EXEC_TIME = Histogram(
+    "offload_exec_seconds",
+    "Time a pool process spent running the task",
+    ["task"],
+    buckets=_BUCKETS,
+)
+IN_FLIGHT = Gauge("offload_in_flight", "Tasks running in the pool")
+WAITING = Gauge("offload_waiting", "Tasks waiting for a free pool process")
+
+
+class OffloadTimeout(Exception):
+    """The task ran past its deadline and its process was killed."""
+
+
+def _limit_memory(limit_mb: int):
+    # Runs once in every new pool process
+    if resource is None or limit_mb <= 0:
+        return
+    limit = limit_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError) as e:
+        print(f"--- OFFLOAD: Could not set memory limit: {e} ---")
+
+
+def _timed_call(fn, args, kwargs):
+    # Wall clock, so the parent can compare it with its own submit time
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return result, started, time.time()
+
+
+class ProcessOffloader:
+    """
+    Runs blocking, CPU-heavy functions in a bounded process pool so they
+    never stall the event loop.
+
+    - At most pool_size tasks are admitted at once; further callers wait
+      their turn (backpressure) instead of piling work into the pool's
+      internal queue, where a deadline can't be enforced fairly.
+    - Each task has a deadline. ProcessPoolExecutor can't cancel a running
+      task, so on a timeout the pool's processes are killed and the pool is
+      rebuilt; other tasks caught in it fail with BrokenProcessPool and are
+      retried by the job queue.
+    - Processes get an RLIMIT_AS memory ceiling, so a pathological PDF raises
+      MemoryError in the child instead of taking the whole pod down.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = OFFLOAD_POOL_SIZE,
+        timeout: float = OFFLOAD_TIMEOUT_SECONDS,
+        memory_limit_mb: int = OFFLOAD_MEMORY_LIMIT_MB,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._slots = asyncio.Semaphore(max(1, pool_size))
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                # Never fork a process that has an event loop and HTTP pools running
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_limit_memory,
+                initargs=(self.memory_limit_mb,),
+                max_tasks_per_child=OFFLOAD_TASKS_PER_CHILD or None,
+            )
+        return self._executor
+
+    def _kill_pool(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # Private, but it's the only handle on a stuck child
+        for process in list(getattr(executor, "_processes", {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn, *args, task: str = "task", timeout: float | None = None, **kwargs):
+        timeout = timeout or self.timeout
+        if self.pool_size <= 0:
+            # Pool disabled: still keep the loop free
+            return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout)
+
+        submitted = time.time()
+        WAITING.inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            WAITING.dec()
+        try:
+            IN_FLIGHT.inc()
+            try:
+                loop = asyncio.get_running_loop()
+                future = loop.run_in_executor(self._pool(), _timed_call, fn, args, kwargs)
+                try:
+                    result, started, finished = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    print(f"--- OFFLOAD: {task} exceeded {timeout:.0f}s, restarting the pool ---")
+                    self._kill_pool()
+                    raise OffloadTimeout(f"{task} exceeded {timeout:.0f}s")
+                except BrokenProcessPool:
+                    # A child died (OOM-killed, segfault in a C library...): start fresh next time
+                    self._kill_pool()
+                    raise
+            finally:
+                IN_FLIGHT.dec()
+        finally:
+            self._slots.release()
+
+        QUEUE_WAIT.labels(task).observe(max(0.0, started - submitted))
+        EXEC_TIME.labels(task).observe(finished - started)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Create a singleton instance
+offloader = ProcessOffloader()
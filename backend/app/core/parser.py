@@ -1,65 +1,195 @@
 import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 import pdfplumber
 import docx
 import pytesseract
 from pdf2image import convert_from_path
+from app.core.offload import OFFLOAD_POOL_SIZE
+from app.core.storage import get_storage, StorageError
 
 logger = logging.getLogger("uvicorn")
 
-def extract_text_from_pdf(file_path: str) -> str:
+# Rasterization settings for scanned pages (grayscale is plenty for OCR and 3x smaller)
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+# Tesseract processes run in parallel per document. Each parse already runs in
+# one of OFFLOAD_POOL_SIZE processes, so by default they split the cores.
+OCR_THREADS = int(os.getenv("OCR_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, OFFLOAD_POOL_SIZE)))))
+# Longest page range rasterized by one poppler call (bounds temp disk use)
+OCR_RASTER_BATCH_PAGES = int(os.getenv("OCR_RASTER_BATCH_PAGES", "16"))
+# Pages parsed per call when the pipeline streams a PDF
+PARSE_BATCH_PAGES = int(os.getenv("PARSE_BATCH_PAGES", "8"))
+
+
+def _page_ranges(page_indexes: list[int], max_pages: int) -> list[tuple[int, int]]:
+    """Groups sorted page indexes into contiguous (first, last) runs of at most max_pages."""
+    ranges = []
+    for i in page_indexes:
+        if ranges and i == ranges[-1][1] + 1 and i - ranges[-1][0] < max_pages:
+            ranges[-1] = (ranges[-1][0], i)
+        else:
+            ranges.append((i, i))
+    return ranges
+
+
+def _ocr_image(path: str) -> tuple[str, float]:
+    started = time.perf_counter()
+    try:
+        return pytesseract.image_to_string(path), time.perf_counter() - started
+    finally:
+        os.remove(path)
+
+
+def ocr_pages(file_path: str, page_indexes: list[int]) -> dict[int, str]:
     """
-    Universal Parser: Handles .txt, .pdf, .docx, and Scanned Images (OCR).
+    OCRs the given (0-based) pages of a stored PDF. Each contiguous run of pages is
+    rasterized by a single poppler call straight to a temp folder, and the
+    images are fed to a pool of tesseract processes while the next run is
+    being rasterized. Returns {page_index: text}; failed pages are missing.
     """
-    print(f"--- PARSER: Starting extraction for {file_path} ---")
-    
-    text_content = ""
-    
+    if OCR_THREADS > 1:
+        # Tesseract's own OpenMP threads fight with ours when pages run in parallel
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    started = time.perf_counter()
+    results = {}
+    # poppler needs a real file; remote blobs are downloaded once per document
+    local_path = get_storage().local_path(file_path)
+    with tempfile.TemporaryDirectory(prefix="guardrail-ocr-") as tmp, \
+            ThreadPoolExecutor(max_workers=max(1, OCR_THREADS)) as pool:
+        futures = {}
+        for first, last in _page_ranges(sorted(page_indexes), OCR_RASTER_BATCH_PAGES):
+            try:
+                raster_started = time.perf_counter()
+                paths = convert_from_path(
+                    local_path,
+                    dpi=OCR_DPI,
+                    grayscale=OCR_GRAYSCALE,
+                    first_page=first + 1,
+                    last_page=last + 1,
+                    output_folder=tmp,
+                    paths_only=True,
+                )
+                print(f"--- PARSER: Rasterized pages {first + 1}-{last + 1} in {time.perf_counter() - raster_started:.2f}s ---")
+            except Exception as e:
+                print(f"--- PARSER OCR ERROR: pages {first + 1}-{last + 1}: {e} ---")
+                continue
+
+            # pdf2image returns the files in page order
+            for offset, path in enumerate(paths):
+                futures[first + offset] = pool.submit(_ocr_image, path)
+
+        for i in sorted(futures):
+            try:
+                text, seconds = futures[i].result()
+                results[i] = text
+                print(f"--- PARSER: OCR Successful for Page {i + 1} ({seconds:.2f}s) ---")
+            except Exception as e:
+                print(f"--- PARSER OCR ERROR: page {i + 1}: {e} ---")
+
+    print(f"--- PARSER: OCR'd {len(results)}/{len(page_indexes)} pages in {time.perf_counter() - started:.2f}s ---")
+    return results
+
+
+class ParseError(Exception):
+    """The file itself can't be read (corrupt, wrong type...). Retrying won't help."""
+
+
+def extract_pages(file_path: str, first: int = 0, count: int | None = None) -> tuple[int, list[str]]:
+    """
+    Extracts pages [first, first + count) of a stored file and returns
+    (total_pages, texts). Plain text and Word files count as a single page.
+    Reading a PDF in batches keeps memory bounded and lets the pipeline
+    start on the first pages while later ones are still being OCR'd.
+    """
+    storage = get_storage()
     try:
         # STRATEGY 1: Text Files
         if file_path.endswith(".txt"):
             print("--- PARSER: Detected Text File ---")
-            with open(file_path, "r", encoding="utf-8") as f:
-                return f.read()
+            if first > 0:
+                return 1, []
+            with storage.open_reader(file_path) as f:
+                return 1, [f.read().decode("utf-8")]
 
         # STRATEGY 2: Word Documents (.docx)
         elif file_path.endswith(".docx"):
             print("--- PARSER: Detected Word Document ---")
-            doc = docx.Document(file_path)
+            if first > 0:
+                return 1, []
+            with storage.open_reader(file_path) as f:
+                doc = docx.Document(f)
             full_text = []
             for para in doc.paragraphs:
                 full_text.append(para.text)
-            return "\n".join(full_text)
+            return 1, ["\n".join(full_text)]
 
         # STRATEGY 3: PDFs (Digital & Scanned)
         else:
-            print("--- PARSER: Detected PDF ---")
-            with pdfplumber.open(file_path) as pdf:
-                print(f"--- PARSER: Found {len(pdf.pages)} pages ---")
-                
-                for i, page in enumerate(pdf.pages):
+            texts = []
+            scanned = []
+            # Seekable reader: remotely, only the byte ranges pdfplumber touches are fetched
+            with storage.open_reader(file_path) as f, pdfplumber.open(f) as pdf:
+                total = len(pdf.pages)
+                last = total if count is None else min(total, first + count)
+                if first == 0:
+                    print(f"--- PARSER: Detected PDF, found {total} pages ---")
+
+                for i in range(first, last):
+                    page = pdf.pages[i]
                     # 3a. Try Digital Extraction first
                     extracted = page.extract_text()
-                    
+                    # Drop pdfplumber's cached layout objects for this page
+                    page.close()
+
                     if extracted and len(extracted.strip()) > 10:
                         # If we found meaningful text, use it
                         print(f"--- PARSER: Page {i+1} is Digital Text ---")
-                        text_content += extracted + "\n"
+                        texts.append(extracted)
                     else:
-                        # 3b. Fallback to OCR (Scanned Image)
-                        print(f"--- PARSER: Page {i+1} has NO text. Switching to OCR... ---")
-                        try:
-                            # Convert this specific page to an image
-                            # Note: We convert the PDF file, grabbing just page i+1
-                            images = convert_from_path(file_path, first_page=i+1, last_page=i+1)
-                            for img in images:
-                                ocr_text = pytesseract.image_to_string(img)
-                                text_content += ocr_text + "\n"
-                            print(f"--- PARSER: OCR Successful for Page {i+1} ---")
-                        except Exception as e:
-                            print(f"--- PARSER OCR ERROR: {e} ---")
-
-            return text_content
+                        # 3b. Scanned Image: collected here, OCR'd in one go below
+                        print(f"--- PARSER: Page {i+1} has NO text. Queued for OCR ---")
+                        texts.append("")
+                        scanned.append(i)
 
+            if scanned:
+                for i, ocr_text in ocr_pages(file_path, scanned).items():
+                    texts[i - first] = ocr_text
+
+            return total, texts
+
+    except StorageError:
+        # The store is unreachable, not the file broken: let the job queue retry
+        raise
     except Exception as e:
         print(f"--- PARSER ERROR: {e} ---")
-        return ""
\ No newline at end of file
+        # Plain message only: it has to pickle back from the offload process
+        raise ParseError(f"{type(e).__name__}: {e}") from None
+
+
+def iter_pages(file_path: str, batch_pages: int = PARSE_BATCH_PAGES) -> Iterator[str]:
+    """Yields the document's pages in order, parsing batch_pages at a time."""
+    first = 0
+    while True:
+        total, texts = extract_pages(file_path, first, batch_pages)
+        yield from texts
+        first += len(texts)
+        if not texts or first >= total:
+            return
+
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """
+    Universal Parser: Handles .txt, .pdf, .docx, and Scanned Images (OCR).
+    Returns the whole text at once; the pipeline streams pages via extract_pages.
+    """
+    print(f"--- PARSER: Starting extraction for {file_path} ---")
+    try:
+        # Every page followed by a newline, in page order
+        return "".join(page + "\n" for page in iter_pages(file_path))
+    except ParseError:
+        return ""
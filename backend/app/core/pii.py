@@ -0,0 +1,244 @@
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import NamedTuple
+
+# 1. OCR-Proof Email (Catches spaces before/after @)
+EMAIL_PATTERN = r'[a-zA-Z0-9._%+-]+\s*@\s*[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+# 2. URL (Catches GitHub, LinkedIn, etc.)
+URL_PATTERN = r'(?:https?://)?(?:www\.)?(?:linkedin\.com|github\.com)\S+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}/\S+'
+# 3. SSN (XXX-XX-XXXX)
+SSN_PATTERN = r'\b\d{3}-\d{2}-\d{4}\b'
+# 4. Credit Card candidates: an unbroken 13-19 digit number, or a stretch of
+#    3+ digit groups joined by the same one-character separator that starts
+#    like a card. No nested or overlapping quantifiers, so a match never
+#    backtracks far; grouping and the Luhn check are applied in Python
+#    (find_credit_cards)
+CARD_NUMBER_PATTERN = r'(?<!\w)\d{13,19}(?!\w)'
+CARD_GROUPED_PATTERN = r'(?<!\w)\d{4}(?!\d)([ -])\d{4,6}(?!\d)(?:\1\d{3,6}(?!\d))+(?!\w)'
+CARD_MIN_DIGITS = 13
+CARD_MAX_DIGITS = 19
+# How cards are printed when they are split into groups (19-digit, 16-digit, Amex, Diners)
+CARD_GROUPINGS = ((4, 4, 4, 4, 3), (4, 4, 4, 4), (4, 6, 5), (4, 6, 4))
+# Issuer prefixes in use (2/5 Mastercard, 3 Amex/Diners/JCB, 4 Visa, 6 Discover/UnionPay)
+CARD_FIRST_DIGITS = "23456"
+# 5. Phone (US Style: 123-456-7890 or (123) 456-7890)
+PHONE_PATTERN = r'\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}'
+
+# When two detections overlap, the lower rank wins (structured PII beats NER guesses)
+LABEL_PRIORITY = {
+    "SSN": 0,
+    "CREDIT_CARD": 1,
+    "EMAIL": 2,
+    "URL": 3,
+    "PHONE": 4,
+    "PER": 5,
+    "ORG": 6,
+    "LOC": 7,
+}
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    label: str
+
+
+_CARD_NUMBER_RE = re.compile(CARD_NUMBER_PATTERN)
+_CARD_GROUPED_RE = re.compile(CARD_GROUPED_PATTERN)
+
+
+# Luhn contribution of a digit in a doubled position
+_LUHN_DOUBLED = [0, 2, 4, 6, 8, 1, 3, 5, 7, 9]
+
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = ord(ch) - 48
+        total += _LUHN_DOUBLED[d] if i % 2 else d
+    return total % 10 == 0
+
+
+def _is_card(digits: str) -> bool:
+    # All zeros pass Luhn but are never a card
+    return luhn_valid(digits) and digits.strip("0") != ""
+
+
+def _tile(groups: list[tuple[int, str]]) -> list[Span]:
+    """Splits (offset, digits) groups into consecutive card groupings that each pass Luhn, or returns []."""
+    spans = []
+    i = 0
+    while i < len(groups):
+        for grouping in CARD_GROUPINGS:
+            if tuple(len(g) for _, g in groups[i:i + len(grouping)]) != grouping:
+                continue
+            digits = "".join(g for _, g in groups[i:i + len(grouping)])
+            if digits[0] in CARD_FIRST_DIGITS and _is_card(digits):
+                last_offset, last_group = groups[i + len(grouping) - 1]
+                spans.append(Span(groups[i][0], last_offset + len(last_group), "CREDIT_CARD"))
+                i += len(grouping)
+                break
+        else:
+            return []
+    return spans
+
+
+def _grouped_cards(text: str, match: re.Match, floor: int) -> tuple[list[Span], int]:
+    """
+    A stretch of groups joined by one separator has to be made up of card
+    groupings that each pass Luhn. Short groups (1-3 digits) are context,
+    like an expiry, a CVV or a quantity, and split the stretch into runs;
+    every run of longer groups must be cards. If one isn't, the stretch is
+    a table row or a list of numbers that merely contains a Luhn-valid
+    window, and none of it counts. Returns the spans and where the stretch
+    ends; it never reaches back before `floor` (the end of the previous one).
+    """
+    separator = match.group(1)
+    start, end = match.span()
+
+    # 1. Take in neighbouring groups the regex couldn't (it starts on 4
+    #    digits, only takes 3+ digit groups and backs off a group glued to a
+    #    word). An id before the stretch is left out; a long group glued to a
+    #    word after it is a glued number or a table cell, so nothing counts
+    while start - 2 >= floor and text[start - 1] == separator and text[start - 2].isdigit():
+        group_start = start - 1
+        while group_start > floor and text[group_start - 1].isdigit():
+            group_start -= 1
+        if group_start and (text[group_start - 1].isalnum() or text[group_start - 1] == "_"):
+            break
+        start = group_start
+    while text[end:end + 1] == separator and text[end + 1:end + 2].isdigit():
+        group_end = end + 1
+        while group_end < len(text) and text[group_end].isdigit():
+            group_end += 1
+        if group_end - end - 1 >= 4 and group_end < len(text) and (text[group_end].isalnum() or text[group_end] == "_"):
+            return [], group_end
+        end = group_end
+
+    groups = []
+    offset = start
+    for group in text[start:end].split(separator):
+        groups.append((offset, group))
+        offset += len(group) + len(separator)
+
+    # 2. Runs of 4+ digit groups between the short ones. A run may take the
+    #    short group after it (19-digit cards end in a 3-digit group)
+    spans = []
+    i = 0
+    while i < len(groups):
+        if len(groups[i][1]) < 4:
+            i += 1
+            continue
+        j = i
+        while j < len(groups) and len(groups[j][1]) >= 4:
+            j += 1
+        run = _tile(groups[i:j + 1]) if j < len(groups) else []
+        if run:
+            j += 1
+        else:
+            run = _tile(groups[i:j])
+            if not run:
+                return [], end
+        spans.extend(run)
+        i = j
+    return spans, end
+
+
+def find_credit_cards(text: str) -> list[Span]:
+    """
+    Linear-time card detection. Each digit run is one candidate, not a
+    source of windows:
+
+    - an unbroken 13-19 digit number is a card if it passes Luhn
+    - grouped digits are split only where the separator changes (so two
+      phone numbers joined by a space stay two numbers), and in each stretch
+      with a consistent separator every run of 4+ digit groups has to be
+      card groupings (4-4-4-4, 4-6-5, ...) that pass Luhn; short groups
+      around them (an expiry, a CVV) are ignored
+
+    Numbers glued to letters (e.g. an order id) don't count. Both scans are
+    linear, so OCR tables and phone lists can't blow up, and digit soup
+    almost never passes.
+    """
+    # 1. Unbroken numbers
+    spans = [
+        Span(m.start(), m.end(), "CREDIT_CARD")
+        for m in _CARD_NUMBER_RE.finditer(text)
+        if _is_card(m.group())
+    ]
+    # 2. Grouped numbers, one stretch per separator (a stretch can run past
+    #    where the regex stopped, so carry on scanning after it)
+    pos = 0
+    while m := _CARD_GROUPED_RE.search(text, pos):
+        found, pos = _grouped_cards(text, m, pos)
+        spans.extend(found)
+    return spans
+
+
+class PIIDetector:
+    """
+    Every pattern compiled into one alternation of named groups, so the text
+    is scanned once; at any position the earlier pattern wins. Credit cards
+    come from the separate linear scanner above (they need a Luhn check a
+    regex can't do), so callers should pass the result through
+    resolve_overlaps.
+    """
+
+    def __init__(self, patterns: dict[str, str], detect_cards: bool = True):
+        self.labels = list(patterns)
+        self.regex = re.compile("|".join(f"(?P<{label}>{pattern})" for label, pattern in patterns.items()))
+        self.detect_cards = detect_cards
+
+    def find(self, text: str) -> list[Span]:
+        spans = [Span(m.start(), m.end(), m.lastgroup) for m in self.regex.finditer(text)]
+        if self.detect_cards:
+            spans.extend(find_credit_cards(text))
+        return spans
+
+
+def resolve_overlaps(spans: list[Span]) -> list[Span]:
+    """
+    Picks a non-overlapping subset: higher-priority labels first, then longer
+    spans, then earlier ones. Returns the winners sorted by start.
+    """
+    ranked = sorted(spans, key=lambda s: (LABEL_PRIORITY.get(s.label, len(LABEL_PRIORITY)), s.start - s.end, s.start))
+    starts: list[int] = []
+    accepted: list[Span] = []
+    for span in ranked:
+        if span.end <= span.start:
+            continue
+        i = bisect_left(starts, span.start)
+        # Neighbours on either side must not overlap
+        if i > 0 and accepted[i - 1].end > span.start:
+            continue
+        if i < len(accepted) and accepted[i].start < span.end:
+            continue
+        starts.insert(i, span.start)
+        accepted.insert(i, span)
+    return accepted
+
+
+def apply_spans(text: str, spans: list[Span]) -> tuple[str, Counter]:
+    """
+    Replaces each (sorted, non-overlapping) span with <LABEL> in a single
+    join, and counts the labels on the way.
+    """
+    parts = []
+    counts: Counter = Counter()
+    position = 0
+    for start, end, label in spans:
+        parts.append(text[position:start])
+        parts.append(f"<{label}>")
+        counts[label] += 1
+        position = end
+    parts.append(text[position:])
+    return "".join(parts), counts
+
+
+# The detector NERRedactor runs next to the model
+default_detector = PIIDetector({
+    "EMAIL": EMAIL_PATTERN,
+    "URL": URL_PATTERN,
+    "SSN": SSN_PATTERN,
+})
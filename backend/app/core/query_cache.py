@@ -0,0 +1,120 @@
+import os
+import re
+import uuid
+from collections import OrderedDict
+import numpy as np
+from prometheus_client import Counter
+
+# Queries remembered per user, and users remembered per process (LRU on both)
+QUERY_CACHE_PER_USER = int(os.getenv("QUERY_CACHE_PER_USER", "64"))
+QUERY_CACHE_MAX_USERS = int(os.getenv("QUERY_CACHE_MAX_USERS", "1000"))
+# Semantic tier: reuse the results of an earlier query whose embedding is at
+# least this similar. 0 turns it off (exact text matches only).
+QUERY_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("QUERY_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+QUERY_CACHE_LOOKUPS = Counter(
+    "query_cache_lookups_total",
+    "Search/chat retrieval cache lookups by tier (exact, semantic) and outcome",
+    ["tier", "result"],
+)
+
+_PUNCTUATION = re.compile(r"[\s?!.,;:]+")
+
+
+def normalize_query(text: str) -> str:
+    # "What's the total?" and "what's the total" are the same question
+    return _PUNCTUATION.sub(" ", text.lower()).strip()
+
+
+class CachedQuery:
+    """The ranked chunk ids (with scores) one query returned, top `limit` of them."""
+
+    def __init__(self, vector: np.ndarray, version: int, limit: int, hits: list[tuple[uuid.UUID, float]]):
+        self.vector = vector
+        self.version = version
+        self.limit = limit
+        self.hits = hits
+
+    def serves(self, version: int, limit: int) -> bool:
+        # Fewer hits than were asked for means that was every match, so any limit is covered
+        return self.version == version and (self.limit >= limit or len(self.hits) < self.limit)
+
+
+class QueryCache:
+    """
+    Per-user cache of query -> top-k chunk ids, in front of embedding +
+    vector search.
+
+    Entries carry the User.corpus_version they were computed against and are
+    only served while it is unchanged, so adding or deleting a document
+    (which bumps the version) retires them everywhere, in every process.
+
+    Exact tier: normalized query text; a hit skips the embedding call too.
+    Semantic tier (opt-in): a new query whose embedding is within
+    QUERY_CACHE_SEMANTIC_THRESHOLD cosine similarity of a cached one reuses
+    its ranking; only the embedding is computed.
+    """
+
+    def __init__(self, per_user: int = QUERY_CACHE_PER_USER, max_users: int = QUERY_CACHE_MAX_USERS,
+                 semantic_threshold: float = QUERY_CACHE_SEMANTIC_THRESHOLD):
+        self.per_user = per_user
+        self.max_users = max_users
+        self.semantic_threshold = semantic_threshold
+        self._users: "OrderedDict[uuid.UUID, OrderedDict[str, CachedQuery]]" = OrderedDict()
+
+    def _entries(self, user_id: uuid.UUID, version: int) -> "OrderedDict[str, CachedQuery]":
+        entries = self._users.get(user_id)
+        if entries is None:
+            return OrderedDict()
+        self._users.move_to_end(user_id)
+        # The corpus moved on: everything older is dead weight
+        if any(entry.version != version for entry in entries.values()):
+            for key in [key for key, entry in entries.items() if entry.version != version]:
+                del entries[key]
+        return entries
+
+    def get(self, user_id: uuid.UUID, query: str, version: int, limit: int) -> CachedQuery | None:
+        key = normalize_query(query)
+        entry = self._entries(user_id, version).get(key)
+        if entry is None or not entry.serves(version, limit):
+            QUERY_CACHE_LOOKUPS.labels("exact", "miss").inc()
+            return None
+        self._users[user_id].move_to_end(key)
+        QUERY_CACHE_LOOKUPS.labels("exact", "hit").inc()
+        return entry
+
+    def get_similar(self, user_id: uuid.UUID, vector: np.ndarray, version: int, limit: int) -> CachedQuery | None:
+        if self.semantic_threshold <= 0:
+            return None
+        candidates = [entry for entry in self._entries(user_id, version).values() if entry.serves(version, limit)]
+        if not candidates:
+            QUERY_CACHE_LOOKUPS.labels("semantic", "miss").inc()
+            return None
+        # Stored vectors are normalized, so one matrix-vector product gives every cosine
+        scores = np.stack([entry.vector for entry in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.semantic_threshold:
+            QUERY_CACHE_LOOKUPS.labels("semantic", "miss").inc()
+            return None
+        QUERY_CACHE_LOOKUPS.labels("semantic", "hit").inc()
+        return candidates[best]
+
+    def put(self, user_id: uuid.UUID, query: str, vector: np.ndarray, version: int, limit: int,
+            hits: list[tuple[uuid.UUID, float]]):
+        entries = self._entries(user_id, version)
+        self._users[user_id] = entries
+        self._users.move_to_end(user_id)
+        key = normalize_query(query)
+        entries[key] = CachedQuery(vector, version, limit, hits)
+        entries.move_to_end(key)
+        while len(entries) > self.per_user:
+            entries.popitem(last=False)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def clear(self):
+        self._users.clear()
+
+
+# Create a singleton instance
+query_cache = QueryCache()
@@ -1,70 +1,98 @@
-# from sentence_transformers import SentenceTransformer
-
-# class EmbeddingEngine:
-#     def __init__(self):
-#         # We use "all-MiniLM-L6-v2". It's small, fast, and very accurate.
-#         # It maps sentences to a 384-dimensional dense vector space.
-#         print("--- RAG: Loading AI Model (this happens once)... ---")
-#         self.model = SentenceTransformer('all-MiniLM-L6-v2')
-#         print("--- RAG: Model Loaded. ---")
+import os
+import time
+import numpy as np
+from app.core.embedding_backends import create_backend
+from app.core.embedding_cache import EmbeddingCache
+from app.core.config import EMBEDDING_DIM
 
-#     def generate_embedding(self, text: str) -> list[float]:
-#         """
-#         Converts text into a list of floating point numbers (Vector).
-#         """
-#         # The model expects a list of sentences, but we can pass a single string.
-#         # .tolist() converts the numpy array to a standard Python list.
-#         embedding = self.model.encode(text).tolist()
-#         return embedding
 
-# # Create a singleton instance
-# embedding_engine = EmbeddingEngine()
+class EmbeddingError(Exception):
+    """
+    Raised when some inputs of a batch could not be embedded.
+    `errors` maps input index -> reason; `vectors` holds every row that did
+    succeed (failed rows are zero).
+    """
+    def __init__(self, errors: dict[int, str], vectors: np.ndarray):
+        super().__init__(f"{len(errors)} of {len(vectors)} embeddings failed")
+        self.errors = errors
+        self.vectors = vectors
 
 
-import os
-import requests
-import time
-
 class EmbeddingEngine:
-    def __init__(self):
-        self.hf_token = os.getenv("HF_TOKEN")
-        # THE FIX: The official pipeline URL announced by the Hugging Face maintainers
-        self.api_url = "https://router.huggingface.co/hf-inference/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction"
-        self.headers = {"Authorization": f"Bearer {self.hf_token}"}
-        print("--- RAG: Configured for Official HF Feature Extraction ---")
+    """
+    Cache + backend. The backend is picked by EMBEDDING_BACKEND:
+    "remote" (Hugging Face API, default), "local" (CPU sentence-transformers)
+    or "hashing" (deterministic, for tests).
+    """
+    def __init__(self, backend_name: str | None = None):
+        self.backend = create_backend(backend_name or os.getenv("EMBEDDING_BACKEND", "remote"))
+        self.model_name = self.backend.model_name
+        self.cache = EmbeddingCache(
+            self.model_name,
+            max_items=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+            disk_path=os.getenv("EMBEDDING_CACHE_PATH"),
+        )
 
-    def generate_embedding(self, text: str) -> list[float]:
-        if not self.hf_token:
-            return [0.0] * 384
+    async def generate_embedding(self, text: str) -> list[float]:
+        """
+        Single-text convenience wrapper. Falls back to a zero vector on failure
+        so callers (search, chat) degrade to "no matches" instead of erroring.
+        """
+        try:
+            return (await self.generate_embeddings([text]))[0].tolist()
+        except EmbeddingError as e:
+            print(f"RAG Request Failed: {e.errors.get(0)}")
+            return [0.0] * EMBEDDING_DIM
 
-        # Wrap the text in a list, which is what the pipeline strictly requires
-        payload = {"inputs": [text]}
+    async def generate_embeddings(self, texts: list[str]) -> np.ndarray:
+        """
+        Embeds many texts with as few backend calls as possible.
+        Cached texts are served from the embedding cache; the rest are
+        de-duplicated and handed to the backend in one call (which batches
+        them its own way). The result is a float32 array of shape
+        (len(texts), 384) in input order.
+        Raises EmbeddingError (with the partial result) if any item failed.
+        """
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        errors: dict[int, str] = {}
+        if not texts:
+            return vectors
 
-        try:
-            response = requests.post(
-                self.api_url, 
-                headers=self.headers, 
-                json=payload,
-                timeout=15
-            )
-            
-            if response.status_code == 503:
-                print("RAG: Model is loading, waiting 5s...")
-                time.sleep(5)
-                return self.generate_embedding(text)
+        # 1. Serve what we can from the cache
+        keys = [self.cache.key(text) for text in texts]
+        cached = await self.cache.get_many(list(dict.fromkeys(keys)))
 
-            if response.status_code == 200:
-                result = response.json()
-                # The API returns a nested list: [[0.1, 0.2, ...]]
-                if isinstance(result, list) and isinstance(result[0], list):
-                     return result[0] 
-                return result
+        # 2. Group the misses so identical texts are only sent once
+        pending: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                vectors[i] = cached[key]
             else:
-                print(f"RAG API Error ({response.status_code}): {response.text}")
-                return [0.0] * 384
-                
-        except Exception as e:
-            print(f"RAG Request Failed: {e}")
-            return [0.0] * 384
+                pending.setdefault(key, []).append(i)
+
+        # 3. Embed the unique misses and remember them
+        if pending:
+            miss_keys = list(pending)
+            miss_texts = [texts[pending[key][0]] for key in miss_keys]
+
+            started = time.perf_counter()
+            miss_vectors, miss_errors = await self.backend.embed(miss_texts)
+            self.cache.record_latency(time.perf_counter() - started, len(miss_texts))
+
+            fresh = {}
+            for j, key in enumerate(miss_keys):
+                for i in pending[key]:
+                    if j in miss_errors:
+                        errors[i] = miss_errors[j]
+                    else:
+                        vectors[i] = miss_vectors[j]
+                if j not in miss_errors:
+                    fresh[key] = miss_vectors[j]
+            await self.cache.put_many(fresh)
+
+        if errors:
+            raise EmbeddingError(errors, vectors)
+        return vectors
+
 
-embedding_engine = EmbeddingEngine()
\ No newline at end of file
+embedding_engine = EmbeddingEngine()
@@ -0,0 +1,175 @@
+import asyncio
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+import httpx
+from prometheus_client import Gauge
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state",
+    "Circuit breaker state per upstream (0=closed, 1=half_open, 2=open)",
+    ["upstream"],
+)
+_STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream is failing: the breaker is open or retries ran out."""
+
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with full jitter. A `Retry-After` header from
+    the upstream overrides the computed delay (still capped at max_delay).
+    """
+
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, response: httpx.Response | None = None) -> float:
+        retry_after = _parse_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter keeps many workers from retrying in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _parse_retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and fails fast
+    for `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+        self._set_state("closed")
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.labels(self.name).set(_STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._set_state("half_open")
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+            print(f"--- CIRCUIT: {self.name} is OPEN after {self.failures} failures ---")
+
+    def release_trial(self):
+        self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def breaker_states() -> dict[str, dict]:
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
+
+
+async def call_with_retry(breaker: CircuitBreaker, send, policy: RetryPolicy | None = None) -> httpx.Response:
+    """
+    Runs `send()` (an async callable returning an httpx.Response) under the
+    breaker, retrying transport errors and 429/5xx-style statuses.
+    Other responses (including 4xx) are returned to the caller as-is; any
+    5xx among them still counts as a failure for the breaker.
+    Raises UpstreamUnavailable when the breaker is open or retries run out.
+    """
+    policy = policy or RetryPolicy()
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{breaker.name} circuit is open")
+
+    last_error = "no attempts made"
+    try:
+        for attempt in range(policy.max_attempts):
+            response = None
+            try:
+                response = await send()
+                if response.status_code not in RetryPolicy.RETRY_STATUSES:
+                    # A 4xx is the caller's problem, the upstream itself is fine
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    return response
+                last_error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                last_error = f"{type(e).__name__}: {e}"
+
+            if attempt + 1 < policy.max_attempts:
+                delay = policy.delay(attempt, response)
+                print(f"{breaker.name}: {last_error}, retrying in {delay:.1f}s ({attempt + 1}/{policy.max_attempts})")
+                await asyncio.sleep(delay)
+    except BaseException:
+        # Cancelled or unexpected error: don't leave a half-open trial hanging
+        breaker.release_trial()
+        raise
+
+    breaker.record_failure()
+    raise UpstreamUnavailable(f"{breaker.name} failed after {policy.max_attempts} attempts ({last_error})")
@@ -0,0 +1,168 @@
+import uuid
+import numpy as np
+from sqlalchemy import update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import Document, DocumentChunk, User
+from app.core.vector_cache import vector_cache, UserVectors
+from app.core.query_cache import query_cache
+from app.core.rag import embedding_engine
+
+
+def _is_postgres(session: AsyncSession) -> bool:
+    return session.bind.dialect.name == "postgresql"
+
+
+async def search_chunks_by_vector(
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    query_vector: list[float],
+    limit: int = 10,
+    min_score: float = 0.01,
+    version: int | None = None,
+) -> list[dict]:
+    """
+    Returns the user's `limit` closest chunks as dicts of
+    {id, document_id, filename, chunk_index, score, text}, best match first.
+
+    On Postgres the ranking and top-k cut happen inside the database
+    (`ORDER BY vector <=> :q LIMIT k` over the HNSW index), so only the
+    winning rows' text is read. Other databases fall back to NumPy
+    over a cached per-user matrix (see vector_cache).
+    """
+    if _is_postgres(session):
+        return await _search_pgvector(session, user_id, query_vector, limit, min_score)
+    return await _search_numpy(session, user_id, query_vector, limit, min_score, version)
+
+
+async def search_chunks_by_query(
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    query: str,
+    limit: int = 10,
+) -> list[dict]:
+    """
+    Embeds `query` and searches the user's chunks, going through the query
+    cache: a repeated question (same text, or a close embedding when the
+    semantic tier is on) against an unchanged corpus costs one version
+    lookup plus loading the winning chunks' text.
+    """
+    version = await get_corpus_version(session, user_id)
+
+    # 1. Asked this before? No embedding call, no ranking
+    cached = query_cache.get(user_id, query, version, limit)
+    if cached is not None:
+        return await _load_hits(session, cached.hits[:limit])
+
+    # 2. Something close enough? Reuse its ranking
+    query_vector = np.asarray(await embedding_engine.generate_embedding(query), dtype=np.float32)
+    norm = np.linalg.norm(query_vector)
+    if norm == 0:
+        # Embedding failed (zero-vector fallback): nothing to match, nothing worth caching
+        return []
+    query_vector /= norm
+    cached = query_cache.get_similar(user_id, query_vector, version, limit)
+    if cached is not None:
+        return await _load_hits(session, cached.hits[:limit])
+
+    # 3. Full search, remembered against this corpus version
+    matches = await search_chunks_by_vector(session, user_id, query_vector.tolist(), limit, version=version)
+    query_cache.put(user_id, query, query_vector, version, limit, [(m["id"], m["score"]) for m in matches])
+    return matches
+
+
+async def get_corpus_version(session: AsyncSession, user_id: uuid.UUID) -> int:
+    return (await session.exec(select(User.corpus_version).where(User.id == user_id))).one()
+
+
+async def bump_corpus_version(session: AsyncSession, user_id: uuid.UUID) -> int:
+    """
+    Marks the user's searchable corpus as changed. Call it in the same
+    transaction that adds or removes chunks; returns the new version.
+    """
+    result = await session.exec(
+        update(User)
+        .where(User.id == user_id)
+        .values(corpus_version=User.corpus_version + 1)
+        .returning(User.corpus_version)
+    )
+    return result.scalar_one()
+
+
+def _hit(row, score: float) -> dict:
+    return {
+        "id": row.id,
+        "document_id": row.document_id,
+        "filename": row.filename,
+        "chunk_index": row.chunk_index,
+        "score": score,
+        "text": row.text,
+    }
+
+
+def _hit_columns():
+    return (
+        DocumentChunk.id,
+        DocumentChunk.document_id,
+        Document.filename,
+        DocumentChunk.chunk_index,
+        DocumentChunk.text,
+    )
+
+
+async def _search_pgvector(session, user_id, query_vector, limit, min_score):
+    distance = DocumentChunk.vector.cosine_distance(query_vector)
+    query = (
+        select(*_hit_columns(), (1 - distance).label("score"))
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(DocumentChunk.user_id == user_id, DocumentChunk.vector.is_not(None))
+        .order_by(distance)
+        .limit(limit)
+    )
+    result = await session.exec(query)
+
+    return [
+        _hit(row, float(row.score))
+        for row in result.all()
+        if row.score is not None and row.score > min_score
+    ]
+
+
+async def _search_numpy(session, user_id, query_vector, limit, min_score, version=None):
+    # 1. Score against the user's cached matrix, loading it (ids + vectors only) on a miss.
+    # The version check is one indexed lookup and catches chunks written by a worker process.
+    if version is None:
+        version = await get_corpus_version(session, user_id)
+    entry = vector_cache.get(user_id, version)
+    if entry is None:
+        result = await session.exec(
+            select(DocumentChunk.id, DocumentChunk.vector).where(
+                DocumentChunk.user_id == user_id, DocumentChunk.vector.is_not(None)
+            )
+        )
+        rows = result.all()
+        entry = vector_cache.put(
+            user_id, UserVectors.build([row.id for row in rows], [row.vector for row in rows], version)
+        )
+
+    # 2. One matrix-vector product + argpartition, then drop the noise
+    top = [(chunk_id, score) for chunk_id, score in entry.top_k(query_vector, limit) if score > min_score]
+    if not top:
+        return []
+
+    # 3. Load text only for the winners
+    return await _load_hits(session, top)
+
+
+async def _load_hits(session, ranked: list[tuple]) -> list[dict]:
+    """Turns [(chunk_id, score)] into hit dicts, keeping the order."""
+    if not ranked:
+        return []
+    text_result = await session.exec(
+        select(*_hit_columns())
+        .join(Document, Document.id == DocumentChunk.document_id)
+        .where(DocumentChunk.id.in_([chunk_id for chunk_id, _ in ranked]))
+    )
+    by_id = {row.id: row for row in text_result.all()}
+
+    return [_hit(by_id[chunk_id], score) for chunk_id, score in ranked if chunk_id in by_id]
@@ -0,0 +1,326 @@
+"""
+Blob storage for uploaded files. The key stored in Document.file_path is
+resolved by the configured driver, so any API or worker pod can read a
+file no matter which pod received the upload.
+
+    STORAGE_BACKEND=local   files under STORAGE_LOCAL_ROOT (default: cwd)
+    STORAGE_BACKEND=s3      objects in S3_BUCKET; set S3_ENDPOINT_URL for MinIO & co.
+
+The API side is async (streamed writes, deletes); the parser side runs in
+the offload processes and is sync (seekable ranged reader, local copy for
+poppler).
+"""
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local").lower()
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", ".")
+S3_BUCKET = os.getenv("S3_BUCKET", "guardrail-uploads")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Multipart part size for uploads (S3 minimum is 5 MB)
+S3_PART_SIZE = max(5, int(os.getenv("S3_PART_SIZE_MB", "8"))) * 1024 * 1024
+# Bytes fetched per ranged GET when the parser reads an object, and how many
+# of those blocks a reader keeps (PDF parsers jump back and forth a lot)
+S3_READ_BLOCK = int(os.getenv("S3_READ_BLOCK_KB", "1024")) * 1024
+S3_READ_CACHE_BLOCKS = int(os.getenv("S3_READ_CACHE_BLOCKS", "32"))
+# Where remote objects are materialized for tools that need a real path (poppler)
+STORAGE_CACHE_DIR = os.getenv("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "guardrail-blobs"))
+
+
+class StorageError(Exception):
+    """The store couldn't be reached or refused the request. Worth retrying."""
+
+
+class BlobStorage:
+    """
+    - open_writer(key): async context manager with `await write(chunk)`;
+      the blob only becomes visible if the block exits cleanly.
+    - iter_chunks(key): async iterator over the blob's bytes.
+    - delete(key): async, missing blobs are ignored.
+    - open_reader(key): sync, seekable binary file (ranged reads remotely).
+    - local_path(key) / discard_local(key): a real file for tools that need one.
+    """
+
+    def open_writer(self, key: str):
+        raise NotImplementedError
+
+    def iter_chunks(self, key: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    def open_reader(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str:
+        raise NotImplementedError
+
+    def discard_local(self, key: str):
+        pass
+
+
+class LocalStorage(BlobStorage):
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    @asynccontextmanager
+    async def open_writer(self, key: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Written under a temp name and renamed, so readers never see half a file
+        partial = f"{path}.partial"
+        try:
+            with open(partial, "wb") as f:
+                yield _LocalWriter(f)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    async def iter_chunks(self, key: str, chunk_size: int = 1024 * 1024):
+        with open(self._path(key), "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                yield chunk
+
+    async def delete(self, key: str):
+        try:
+            await asyncio.to_thread(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def open_reader(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def local_path(self, key: str) -> str:
+        return self._path(key)
+
+
+class _LocalWriter:
+    def __init__(self, f):
+        self._f = f
+
+    async def write(self, chunk: bytes):
+        # 1 MB chunks: a plain write doesn't hold the loop for long
+        self._f.write(chunk)
+
+
+class S3Storage(BlobStorage):
+    """
+    Any S3-compatible store (AWS, MinIO, Ceph, R2...). boto3 is sync, so
+    API-side calls run in a thread; parser-side calls are sync anyway.
+    Credentials come from the usual AWS_* variables / instance role.
+    """
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str | None = S3_ENDPOINT_URL, region: str = S3_REGION):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as e:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the boto3 package") from e
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=Config(retries={"max_attempts": 5, "mode": "standard"}, s3={"addressing_style": "path" if endpoint_url else "auto"}),
+        )
+        print(f"--- STORAGE: Using bucket '{bucket}' at {endpoint_url or 'AWS'} ---")
+
+    def _call(self, method: str, **kwargs):
+        from botocore.exceptions import BotoCoreError, ClientError
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, **kwargs)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code", "")
+            if code in ("NoSuchKey", "404", "NotFound"):
+                raise FileNotFoundError(kwargs.get("Key")) from None
+            raise StorageError(f"s3 {method}: {e}") from None
+        except BotoCoreError as e:
+            raise StorageError(f"s3 {method}: {e}") from None
+
+    @asynccontextmanager
+    async def open_writer(self, key: str):
+        writer = _S3Writer(self, key)
+        try:
+            yield writer
+            await writer.finish()
+        except BaseException:
+            await asyncio.shield(writer.abort())
+            raise
+
+    async def iter_chunks(self, key: str, chunk_size: int = 1024 * 1024):
+        body = (await asyncio.to_thread(self._call, "get_object", Key=key))["Body"]
+        try:
+            while chunk := await asyncio.to_thread(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, key: str):
+        # S3 deletes are idempotent, a missing key is not an error
+        await asyncio.to_thread(self._call, "delete_object", Key=key)
+
+    def open_reader(self, key: str) -> BinaryIO:
+        size = self._call("head_object", Key=key)["ContentLength"]
+        return io.BufferedReader(_S3RangeReader(self, key, size))
+
+    def _cache_path(self, key: str) -> str:
+        name = hashlib.sha1(key.encode()).hexdigest() + os.path.splitext(key)[1]
+        return os.path.join(STORAGE_CACHE_DIR, name)
+
+    def local_path(self, key: str) -> str:
+        # Downloaded once per document and shared by every batch (and process) on this host
+        path = self._cache_path(key)
+        if os.path.exists(path):
+            return path
+        os.makedirs(STORAGE_CACHE_DIR, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=STORAGE_CACHE_DIR, suffix=".partial")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                body = self._call("get_object", Key=key)["Body"]
+                shutil.copyfileobj(body, f, S3_READ_BLOCK)
+            os.replace(partial, path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return path
+
+    def discard_local(self, key: str):
+        try:
+            os.remove(self._cache_path(key))
+        except FileNotFoundError:
+            pass
+
+
+class _S3Writer:
+    """Buffers up to one part; small files are a single PUT, big ones a multipart upload."""
+
+    def __init__(self, storage: S3Storage, key: str):
+        self.storage = storage
+        self.key = key
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= S3_PART_SIZE:
+            await self._upload_part()
+
+    async def _upload_part(self):
+        if self.upload_id is None:
+            created = await asyncio.to_thread(self.storage._call, "create_multipart_upload", Key=self.key)
+            self.upload_id = created["UploadId"]
+        number = len(self.parts) + 1
+        part = await asyncio.to_thread(
+            self.storage._call, "upload_part",
+            Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=bytes(self.buffer),
+        )
+        self.parts.append({"PartNumber": number, "ETag": part["ETag"]})
+        self.buffer.clear()
+
+    async def finish(self):
+        if self.upload_id is None:
+            await asyncio.to_thread(self.storage._call, "put_object", Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            await self._upload_part()
+        await asyncio.to_thread(
+            self.storage._call, "complete_multipart_upload",
+            Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts},
+        )
+
+    async def abort(self):
+        if self.upload_id is None:
+            return
+        try:
+            await asyncio.to_thread(self.storage._call, "abort_multipart_upload", Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            # The bucket's lifecycle rule for incomplete uploads cleans up after us
+            print(f"--- STORAGE: Could not abort upload of {self.key}: {e} ---")
+
+
+class _S3RangeReader(io.RawIOBase):
+    """
+    Seekable view of an object, fetched in S3_READ_BLOCK-sized ranged GETs.
+    The most recent blocks are kept, so pdfplumber jumping between the xref
+    table and page objects doesn't refetch them, and only the parts of the
+    PDF it actually touches are ever downloaded.
+    """
+
+    def __init__(self, storage: S3Storage, key: str, size: int):
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.position = 0
+        self.blocks: OrderedDict[int, bytes] = OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def _block(self, index: int) -> bytes:
+        block = self.blocks.get(index)
+        if block is None:
+            start = index * S3_READ_BLOCK
+            end = min(self.size, start + S3_READ_BLOCK) - 1
+            block = self.storage._call("get_object", Key=self.key, Range=f"bytes={start}-{end}")["Body"].read()
+            self.blocks[index] = block
+            if len(self.blocks) > S3_READ_CACHE_BLOCKS:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(index)
+        return block
+
+    def readinto(self, buffer):
+        if self.position >= self.size or len(buffer) == 0:
+            return 0
+        index, offset = divmod(self.position, S3_READ_BLOCK)
+        data = self._block(index)[offset:offset + len(buffer)]
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def _create_storage() -> BlobStorage:
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+_storage: BlobStorage | None = None
+
+
+def get_storage() -> BlobStorage:
+    """Built on first use, so each offload process creates its own client."""
+    global _storage
+    if _storage is None:
+        _storage = _create_storage()
+    return _storage
@@ -0,0 +1,128 @@
+"""
+Streams a multipart/form-data upload straight from the request body into
+blob storage. Starlette's UploadFile spools the whole body to a temp file
+before the endpoint runs, so a size cap there only kicks in once the bytes
+are already on disk; here every chunk is counted, hashed and written as it
+arrives, and the request is cut off as soon as it's over the limit (chunked
+bodies without a Content-Length included).
+"""
+import hashlib
+import os
+from contextlib import AsyncExitStack
+from typing import Callable, NamedTuple
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.core.storage import get_storage
+
+# Room for the multipart boundaries, part headers and small form fields
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The body went over the size limit; nothing was kept."""
+
+
+class MalformedUpload(Exception):
+    """Not a multipart body, cut short, or without the file field."""
+
+
+class StreamedUpload(NamedTuple):
+    filename: str
+    content_type: str | None
+    key: str
+    size: int
+    sha256: str
+
+
+class _Events:
+    """
+    MultipartParser callbacks are sync; they only queue what happened, and
+    the async side drains the queue after each chunk (storage writes await).
+    """
+
+    def __init__(self):
+        self.queue = []
+        self._field = bytearray()
+        self._value = bytearray()
+        self._headers = {}
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._value.extend(data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": lambda: self.queue.append(("headers", self._headers)),
+            "on_part_data": lambda data, start, end: self.queue.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: self.queue.append(("end", None)),
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_end(self):
+        self._headers[bytes(self._field).lower()] = bytes(self._value)
+        self._field.clear()
+        self._value.clear()
+
+    def drain(self) -> list:
+        events, self.queue = self.queue, []
+        return events
+
+
+async def receive_file(request, field: str, key_for: Callable[[str], str], max_bytes: int) -> StreamedUpload:
+    """
+    Reads the request body and writes the `field` file part to storage under
+    key_for(filename). Other parts are skipped. Raises UploadTooLarge or
+    MalformedUpload; either way the partial object is discarded.
+    """
+    mimetype, params = parse_options_header(request.headers.get("content-type", ""))
+    if mimetype != b"multipart/form-data" or not params.get(b"boundary"):
+        raise MalformedUpload("Expected a multipart/form-data body")
+
+    events = _Events()
+    parser = MultipartParser(params[b"boundary"], events.callbacks())
+    digest = hashlib.sha256()
+    received = 0
+    upload = None
+    in_file = False
+    done = False
+
+    async with AsyncExitStack() as stack:
+        async for chunk in request.stream():
+            # 1. Whole body first, so huge non-file parts can't get through either
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                raise UploadTooLarge()
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise MalformedUpload(str(e))
+
+            # 2. Then whatever the parser found in it
+            for kind, value in events.drain():
+                if kind == "headers":
+                    _, disposition = parse_options_header(value.get(b"content-disposition", b""))
+                    name = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    in_file = name == field and b"filename" in disposition and upload is None
+                    if in_file:
+                        filename = os.path.basename(disposition[b"filename"].decode("utf-8", "replace")) or "upload"
+                        content_type = value.get(b"content-type", b"").decode("latin-1") or None
+                        key = key_for(filename)
+                        blob = await stack.enter_async_context(get_storage().open_writer(key))
+                        upload = StreamedUpload(filename, content_type, key, 0, "")
+                elif kind == "data" and in_file:
+                    size = upload.size + len(value)
+                    if size > max_bytes:
+                        raise UploadTooLarge()
+                    digest.update(value)
+                    await blob.write(value)
+                    upload = upload._replace(size=size)
+                elif kind == "end" and in_file:
+                    in_file = False
+                    done = True
+
+        if not done:
+            raise MalformedUpload(f"No complete '{field}' file in the upload")
+
+    return upload._replace(sha256=digest.hexdigest())
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from prometheus_client import Counter
+from app.models import User
+
+# How long a looked-up user is trusted before hitting the DB again (0 disables the cache).
+# Changes made through this process invalidate right away; other pods catch up within the TTL.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+AUTH_CACHE_MAX_USERS = int(os.getenv("AUTH_CACHE_MAX_USERS", "10000"))
+
+USER_CACHE_LOOKUPS = Counter(
+    "auth_user_cache_lookups_total",
+    "get_current_user lookups by outcome (hit, miss, expired)",
+    ["result"],
+)
+
+
+class UserCache:
+    """
+    Short-TTL, in-process cache of User rows keyed by the token subject
+    (the email), so every authenticated request doesn't cost a user lookup.
+    Entries are detached copies; callers get their own copy each time and
+    can't mutate what other requests see.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL_SECONDS, max_users: int = AUTH_CACHE_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> User | None:
+        if self.ttl <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                USER_CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            expires_at, fields = entry
+            if expires_at < time.monotonic():
+                del self._entries[subject]
+                USER_CACHE_LOOKUPS.labels("expired").inc()
+                return None
+            self._entries.move_to_end(subject)
+        USER_CACHE_LOOKUPS.labels("hit").inc()
+        return User(**fields)
+
+    def put(self, subject: str, user: User):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, user.model_dump())
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        """Call whenever a user row is created, changed or deleted."""
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Create a singleton instance
+user_cache = UserCache()
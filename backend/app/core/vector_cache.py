@@ -0,0 +1,161 @@
+import os
+import threading
+import uuid
+from collections import OrderedDict
+import numpy as np
+from app.core.config import EMBEDDING_DIM
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes each row in place. Zero rows stay zero (they score 0).
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class UserVectors:
+    """
+    One user's chunk vectors as a contiguous, L2-normalized float32 matrix.
+    Row i belongs to ids[i]. `version` is the User.corpus_version it reflects.
+    """
+
+    def __init__(self, ids: list, matrix: np.ndarray, version: int = 0):
+        self.ids = ids
+        self.matrix = matrix
+        self.version = version
+
+    @classmethod
+    def build(cls, ids: list, vectors, version: int = 0) -> "UserVectors":
+        matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(len(ids), EMBEDDING_DIM))
+        return cls(list(ids), normalize_rows(matrix), version)
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def top_k(self, query_vector, k: int) -> list[tuple]:
+        """
+        Cosine similarity against every row with one matrix-vector product,
+        then an O(n) argpartition for the top-k. Returns [(id, score)] best first.
+        """
+        if not self.ids or k <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+
+        scores = self.matrix @ (query / norm)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+    def with_vectors(self, ids: list, vectors, version: int) -> "UserVectors":
+        """Returns a copy with `ids` appended (or replaced if already present)."""
+        replaced = set(ids)
+        keep = [i for i, existing in enumerate(self.ids) if existing not in replaced]
+        added = UserVectors.build(ids, vectors)
+        return UserVectors(
+            [self.ids[i] for i in keep] + added.ids,
+            np.vstack([self.matrix[keep], added.matrix]),
+            version,
+        )
+
+    def without(self, ids, version: int) -> "UserVectors":
+        removed = set(ids)
+        keep = [i for i, existing in enumerate(self.ids) if existing not in removed]
+        return UserVectors([self.ids[i] for i in keep], self.matrix[keep], version)
+
+
+class UserVectorCache:
+    """
+    In-process LRU of UserVectors keyed by user id, bounded by total bytes.
+
+    A single user may take at most `max_user_fraction` of the budget; bigger
+    corpora are scored but never cached, so a few heavy users can't evict
+    everyone else. Entries are replaced, never mutated, so readers don't need
+    the lock while scoring.
+
+    Documents may be indexed by another process (app.worker), so every entry
+    carries the User.corpus_version it was built from and is only served
+    while that is still the current version.
+    """
+
+    def __init__(self, max_bytes: int, max_user_fraction: float = 0.25):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = int(max_bytes * max_user_fraction)
+        self._entries: "OrderedDict[uuid.UUID, UserVectors]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version: int) -> UserVectors | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry.version != version:
+                self._drop(user_id)
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def put(self, user_id, entry: UserVectors) -> UserVectors:
+        with self._lock:
+            self._store(user_id, entry)
+        return entry
+
+    def add(self, user_id, ids: list, vectors, version: int):
+        """
+        Incrementally adds/replaces rows if the user is cached. `version` is
+        the corpus version after the change; if the entry missed a change
+        made elsewhere in between, it's dropped instead.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry.version != version - 1:
+                self._drop(user_id)
+                return
+            self._store(user_id, entry.with_vectors(ids, vectors, version))
+
+    def remove(self, user_id, ids, version: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            if entry.version != version - 1:
+                self._drop(user_id)
+                return
+            self._store(user_id, entry.without(ids, version))
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._drop(user_id)
+
+    def _store(self, user_id, entry: UserVectors):
+        self._drop(user_id)
+        if entry.nbytes > self.max_entry_bytes:
+            return
+        self._entries[user_id] = entry
+        self._bytes += entry.nbytes
+        # Evict least recently used users until we're back under budget
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+
+# Create a singleton instance
+vector_cache = UserVectorCache(
+    max_bytes=int(float(os.getenv("VECTOR_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    max_user_fraction=float(os.getenv("VECTOR_CACHE_MAX_USER_FRACTION", "0.25")),
+)
@@ -35,9 +35,42 @@
 
 
 import os
+import time
+import uuid
+from prometheus_client import Gauge, Histogram
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.core.config import EMBEDDING_DIM
+
+# Log every SQL statement (debugging only, far too noisy for production)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+# Connections kept open per process, and how many more may be opened under bursts
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# How long a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Serverless Postgres (Neon) closes idle connections: recycle before it does,
+# and ping on checkout so a dead one is replaced instead of failing the request
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Behind pgbouncer in transaction mode (Neon's "-pooler" endpoints) prepared
+# statements can't be cached per connection. "auto" detects Neon's pooler host.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "auto").lower()
+
+POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent getting a connection from the pool (includes opening new ones)",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+CHECKOUT_TIME = Histogram(
+    "db_connection_checkout_seconds",
+    "How long a connection stays checked out of the pool",
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
 
 # 1. Grab the URL from the environment
 database_url = os.getenv("DATABASE_URL", "")
@@ -46,21 +79,135 @@ database_url = os.getenv("DATABASE_URL", "")
 if "sslmode=" in database_url:
     database_url = database_url.replace("sslmode=", "ssl=")
 
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default async pool, timing how long each checkout waits."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started)
+
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": DB_ECHO}
+    parsed = make_url(url) if url else None
+    if parsed is None or parsed.get_backend_name() == "sqlite":
+        # SQLite picks its own pool; the settings below are for Postgres
+        return options
+
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    pgbouncer = DB_PGBOUNCER in ("1", "true", "yes") or (
+        DB_PGBOUNCER == "auto" and "-pooler" in (parsed.host or "")
+    )
+    if pgbouncer and parsed.get_driver_name() == "asyncpg":
+        options["connect_args"] = {
+            # A pooled server connection may be another client's next time, so
+            # no statement cache, and unique names so prepared statements never clash
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+
 # 3. Create the Engine
-engine = create_async_engine(database_url, echo=True)
+engine = create_async_engine(database_url, **_engine_options(database_url))
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    started = connection_record.info.pop("checked_out_at", None)
+    if started is not None:
+        CHECKOUT_TIME.observe(time.perf_counter() - started)
+
+
+def _pool_stat(name: str):
+    pool = engine.sync_engine.pool
+    return lambda: getattr(pool, name)() if hasattr(pool, name) else 0
+
+
+Gauge("db_pool_checked_out", "Connections currently in use").set_function(_pool_stat("checkedout"))
+Gauge("db_pool_overflow", "Connections open beyond pool_size").set_function(_pool_stat("overflow"))
+Gauge("db_pool_size", "Configured pool size").set_function(_pool_stat("size"))
+
+# 4. One session factory for the whole process (requests, workers, scripts)
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 async def init_db():
     # Import here to avoid circular imports
     from app.models import SQLModel
     async with engine.begin() as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            # The extension must exist before create_all can emit vector(384) columns
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
         await conn.run_sync(SQLModel.metadata.create_all)
+        if is_postgres:
+            await migrate_schema(conn)
+
+
+async def migrate_schema(conn):
+    """
+    Upgrades a legacy JSON `document.vector` column to pgvector in place,
+    adds columns newer code expects and makes sure the indexes exist.
+    Safe to run on every boot.
+    """
+    result = await conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'document' AND column_name = 'vector'"
+    ))
+    data_type = result.scalar()
+
+    if data_type in ("json", "jsonb"):
+        print("--- DB: Migrating document.vector from JSON to pgvector... ---")
+        # '[0.1, 0.2, ...]' is already valid vector text input, but rows saved
+        # without a vector hold JSON 'null', which the cast would choke on
+        await conn.execute(text(
+            f"ALTER TABLE document ALTER COLUMN vector TYPE vector({EMBEDDING_DIM}) "
+            f"USING CASE WHEN vector IS NULL OR json_typeof(vector::json) <> 'array' THEN NULL "
+            f"ELSE (vector::text)::vector({EMBEDDING_DIM}) END"
+        ))
+        # Old failed API calls stored all-zero vectors; cosine distance is undefined for them
+        await conn.execute(text("UPDATE document SET vector = NULL WHERE vector_norm(vector) = 0"))
+        print("--- DB: Vector migration complete ---")
+
+    # create_all never alters existing tables
+    await conn.execute(text(
+        'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS corpus_version INTEGER NOT NULL DEFAULT 0'
+    ))
+    await conn.execute(text("ALTER TABLE document ADD COLUMN IF NOT EXISTS pages_done INTEGER NOT NULL DEFAULT 0"))
+    await conn.execute(text("ALTER TABLE document ADD COLUMN IF NOT EXISTS pages_total INTEGER"))
+    await conn.execute(text("ALTER TABLE document ADD COLUMN IF NOT EXISTS content_hash VARCHAR"))
+
+    # create_all only indexes new tables, so add these for existing deployments too
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_user_id ON document (user_id)"))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_content_hash ON document (content_hash)"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_document_user_created ON document (user_id, created_at, id)"
+    ))
+    # No query searches document.vector, so its HNSW index (added by earlier
+    # versions) only slowed down writes
+    await conn.execute(text("DROP INDEX IF EXISTS ix_document_vector_hnsw"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_documentchunk_vector_hnsw "
+        "ON documentchunk USING hnsw (vector vector_cosine_ops)"
+    ))
 
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
-        yield session
-
-# Exposed for background tasks (like our document processor)
-async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
\ No newline at end of file
+        yield session
\ No newline at end of file
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
@@ -9,29 +10,38 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlmodel import select
 # from app.core.security import verify_password, create_access_token
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES
-from datetime import timedelta
+from datetime import datetime, timedelta
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt import PyJWTError
 import jwt
 from app.core.config import SECRET_KEY, ALGORITHM
-import shutil
 import os
-from fastapi import UploadFile, File
+from fastapi import UploadFile, File, Request, Response, Query
 import uuid
-from app.models import Document # Make sure Document is imported!
-from fastapi import BackgroundTasks
-from app.core.parser import extract_text_from_pdf
+from app.models import Document, DocumentChunk, DocumentSummary, ProcessingJob # Make sure Document is imported!
 from app.db import async_session
 # from app.core.redactor import redact_text
-from app.core.rag import embedding_engine
-import numpy as np
+from app.core.search import search_chunks_by_query, bump_corpus_version
+from app.core.vector_cache import vector_cache
+from app.core import jobs
+from app.worker import Worker
+from app.pipeline import find_processed_duplicate, copy_processed_document
+from app.core.offload import offloader
+from app.core.storage import get_storage
+from app.core.uploads import receive_file, UploadTooLarge, MalformedUpload, MULTIPART_OVERHEAD_BYTES
+from app.core.user_cache import user_cache
+from sqlalchemy import delete, tuple_
+import base64
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import make_asgi_app
 from app.core.chat import chat_engine
+from app.core.context import build_prompt
 from pydantic import BaseModel
 from typing import List, Dict
 from fastapi.responses import StreamingResponse
-from app.core.ner import ner_redactor
+from app.core.http import close_http_client
+from app.core.resilience import breaker_states
 import os
 from pydantic import BaseModel
 from app.auth import (
@@ -52,103 +62,94 @@ class GoogleAuthRequest(BaseModel):
 # The tokenUrl="token" tells Swagger UI where to go to get the token.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_session)
-):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+# Read-only endpoints trust the user id and role signed into the token instead of
+# looking the user up. Faster, but a deleted user keeps read access until the
+# token expires, so it's opt-in.
+AUTH_TRUSTED_CLAIMS = os.getenv("AUTH_TRUSTED_CLAIMS", "false").lower() in ("1", "true", "yes")
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+def decode_token(token: str) -> dict:
     try:
-        # 1. Decode the Token
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except PyJWTError:
         raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_session)
+):
+    # 1. Decode the Token
+    email: str = decode_token(token)["sub"]
+
+    # 2. Seen this user a moment ago? Skip the DB
+    user = user_cache.get(email)
+    if user is not None:
+        return user
     
-    # 2. Find the User in DB
+    # 3. Find the User in DB
     query = select(User).where(User.email == email)
     result = await session.exec(query)
     user = result.first()
     
     if user is None:
         raise credentials_exception
-        
+
+    user_cache.put(email, user)
     return user
 
 
-async def process_document(doc_id: uuid.UUID, file_path: str, session_factory):
-    print(f"Processing document {doc_id}...")
-    
-    # 1. Extract
-    raw_text = extract_text_from_pdf(file_path)
-    
-    status = "failed"
-    clean_text = ""
-    doc_vector = None
-    risk_score = 0  # <--- Initialize Risk Score
-    
-    if raw_text:
-        try:
-            # 2. Redact & Count Stats (The NER Update)
-            # ner_redactor.redact now returns (text, stats_dict)
-            clean_text, stats = ner_redactor.redact(raw_text) 
-            
-            status = "completed"
-            
-            # 3. Calculate Risk Score
-            # High Risk (10 pts): SSN, Credit Cards
-            # Low Risk (1 pt): Names, Emails, Orgs
-            # 3. Calculate Risk Score
-            # CRITICAL (Instant High Risk)
-            critical_score = (stats.get("SSN", 0) * 100) + \
-                             (stats.get("CREDIT_CARD", 0) * 100)
-            
-            # SENSITIVE (Medium Risk)
-            sensitive_score = (stats.get("EMAIL", 0) * 10) + \
-                              (stats.get("PHONE", 0) * 10) # If you add phone later
-            
-            # CONTEXT (Low Risk - weighted very low)
-            context_score = (stats.get("PER", 0) * 1) + \
-                            (stats.get("ORG", 0) * 0.5) + \
-                            (stats.get("LOC", 0) * 0.5)
-                            
-            risk_score = int(critical_score + sensitive_score + context_score)
-            
-            # 4. Vectorize
-            # Vectorize the FIRST 1000 characters (Context Window)
-            doc_vector = embedding_engine.generate_embedding(clean_text[:1000])
-            
-        except Exception as e:
-            print(f"--- PROCESSING ERROR: {e} ---")
-            status = "failed"
-    
-    # 5. Update DB
-    async with session_factory() as session:
-        # Re-fetch the doc using the new session
-        doc = await session.get(Document, doc_id)
-        if doc:
-            doc.text_content = clean_text
-            doc.status = status
-            doc.vector = doc_vector
-            doc.risk_score = risk_score  # <--- Save the Score
-            
-            session.add(doc)
-            await session.commit()
-            print(f"Document {doc_id} processed. Risk Score: {risk_score}")
+async def get_reader(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    get_current_user for endpoints that only read the caller's own data.
+    With AUTH_TRUSTED_CLAIMS the user comes straight from the token: only
+    id, email and role are filled in.
+    """
+    if AUTH_TRUSTED_CLAIMS:
+        payload = decode_token(token)
+        if payload.get("uid"):
+            try:
+                return User(id=uuid.UUID(payload["uid"]), email=payload["sub"], role=payload.get("role", "user"))
+            except ValueError:
+                raise credentials_exception
+    # Older tokens without a uid claim take the normal path
+    return await get_current_user(token, session)
+
+
+# Run a document worker inside the API process (turn off when app.worker runs separately)
+EMBEDDED_WORKER = os.getenv("EMBEDDED_WORKER", "true").lower() in ("1", "true", "yes")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Startup: Connecting to Database...")
     await init_db()
+
+    # Process uploads in this process too, unless a separate worker deployment does it
+    stop_worker = asyncio.Event()
+    worker_task = None
+    if EMBEDDED_WORKER:
+        worker_task = asyncio.create_task(Worker(async_session).run(stop_worker))
+
     yield
     print("Shutdown: Closing connections...")
+    if worker_task is not None:
+        stop_worker.set()
+        await worker_task
+    offloader.shutdown()
+    await close_http_client()
 
 # 1. Initialize the App ONCE here
 app = FastAPI(title="GuardRail AI API", version="0.1.0", lifespan=lifespan)
@@ -163,8 +164,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursor for GET /documents/
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Prometheus scrape endpoint (cache hit rates, latencies, ...)
+app.mount("/metrics", make_asgi_app())
+
+
+
+# How many chunks /chat/ retrieves; build_prompt then packs as many as fit CHAT_PROMPT_TOKENS
+CHAT_TOP_CHUNKS = int(os.getenv("CHAT_TOP_CHUNKS", "8"))
 
 
 class ChatRequest(BaseModel):
@@ -176,6 +186,15 @@ class ChatRequest(BaseModel):
 async def health_check():
     return {"status": "active", "message": "GuardRail AI is online"}
 
+
+@app.get("/health/upstreams")
+async def upstream_health():
+    """
+    Circuit breaker state for each inference upstream (HF NER, embeddings).
+    "open" means calls are failing fast / falling back.
+    """
+    return breaker_states()
+
 # 2. POST endpoint to create a user
 @app.post("/users/")
 async def create_user(user: User, session: AsyncSession = Depends(get_session)):
@@ -190,6 +209,7 @@ async def create_user(user: User, session: AsyncSession = Depends(get_session)):
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    user_cache.invalidate(user.email)
     return user
 
 # 3. GET endpoint to list all users
@@ -222,7 +242,7 @@ async def login_for_access_token(
     # 3. Create the Token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": str(user.id), "role": user.role}, expires_delta=access_token_expires
     )
 
     # 4. Return the Token
@@ -254,11 +274,12 @@ async def google_login(request: GoogleAuthRequest, session: AsyncSession = Depen
         session.add(user)
         await session.commit()
         await session.refresh(user)
+        user_cache.invalidate(user.email)
 
     # 4. Generate OUR Session Token (JWT)
     # This logs them in just like a password user
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role},
+        data={"sub": user.email, "uid": str(user.id), "role": user.role},
         expires_delta=timedelta(minutes=60)
     )
     
@@ -273,71 +294,169 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
     """
     return current_user
 
+# Key prefix in the blob store (a folder under STORAGE_LOCAL_ROOT for local storage)
 UPLOAD_DIR = "uploads"
+# Uploads bigger than this are cut off mid-stream (app.core.uploads), before they fill the disk
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+# Identical bytes from *another* user may reuse their processed copy (off by default)
+DEDUP_ACROSS_USERS = os.getenv("DEDUP_ACROSS_USERS", "false").lower() in ("1", "true", "yes")
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB",
+    )
+
+
+# The body is parsed by hand (see app.core.uploads), so describe it for /docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
 
-@app.post("/upload/")
+@app.post("/upload/", openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
     session: AsyncSession = Depends(get_session)
 ):
+    # 0. Obvious oversize uploads are refused from the header before reading anything
+    declared_size = request.headers.get("content-length")
+    if declared_size and declared_size.isdigit() and int(declared_size) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise _too_large()
+
     # 1. Generate the ID first
     file_id = uuid.uuid4()
-    
-    # 2. Setup the path (Inside the function is safer!)
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}_{file.filename}")
-    
-    # 3. Save the file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
+
+    # 2. Stream the file part to storage as it arrives, capped and hashed as we go
+    #    (the key is the same on every pod; a failed or oversize upload never becomes visible)
+    try:
+        upload = await receive_file(request, "file", lambda filename: f"{UPLOAD_DIR}/{file_id}_{filename}", MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
+        raise _too_large()
+    except MalformedUpload as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    file_path, saved_size, content_hash = upload.key, upload.size, upload.sha256
+
     # --- DEBUG: Print what we just saved ---
-    saved_size = os.path.getsize(file_path)
-    print(f"--- UPLOAD DEBUG: Saved '{file.filename}' to '{file_path}'")
-    print(f"--- UPLOAD DEBUG: File Size on Disk: {saved_size} bytes ---")
+    print(f"--- UPLOAD DEBUG: Saved '{upload.filename}' to '{file_path}'")
+    print(f"--- UPLOAD DEBUG: Stored Size: {saved_size} bytes, sha256 {content_hash[:12]} ---")
     # ---------------------------------------
 
     # 4. Create DB Record
     doc = Document(
         id=file_id,
-        filename=file.filename,
+        filename=upload.filename,
         file_size=saved_size, # Use the actual saved size
-        content_type=file.content_type,
+        content_type=upload.content_type,
         file_path=file_path,
+        content_hash=content_hash,
         user_id=current_user.id,
         status="processing"
     )
+
+    # 5. Seen these exact bytes before? Reuse that work instead of OCR + NER + embedding again
+    source = await find_processed_duplicate(session, content_hash, current_user.id, DEDUP_ACROSS_USERS)
+    if source is not None:
+        chunks = await copy_processed_document(session, source, doc)
+        version = await bump_corpus_version(session, current_user.id)
+        await session.commit()
+        indexed = [c for c in chunks if c.vector is not None]
+        vector_cache.add(current_user.id, [c.id for c in indexed], [c.vector for c in indexed], version)
+        print(f"--- UPLOAD DEBUG: Reused processing of {source.id} ---")
+        return {"message": "Upload complete (identical file already processed)", "document_id": doc.id, "status": "completed"}
     
+    # 6. Queue it for a worker (same transaction, so no document without a job)
     session.add(doc)
+    jobs.enqueue(session, doc.id, file_path)
     await session.commit()
+    jobs.notify()
     await session.refresh(doc)
     
-    # 5. Trigger Background Task
-    background_tasks.add_task(process_document, doc.id, file_path, async_session)
-    
     return {"message": "Upload started", "document_id": doc.id, "status": "processing"}
 
 
-@app.get("/documents/")
+# Only these columns are read for list views (never text_content or the vector)
+SUMMARY_COLUMNS = [getattr(Document, name) for name in DocumentSummary.model_fields]
+
+
+def _encode_cursor(created_at: datetime, doc_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{doc_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        created_at, doc_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(doc_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/documents/", response_model=List[DocumentSummary])
 async def list_documents(
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: str | None = None,
+    current_user: User = Depends(get_reader),
     session: AsyncSession = Depends(get_session)
 ):
     """
-    Get all documents owned by the logged-in user.
+    The logged-in user's documents, newest first, `limit` at a time.
+    If there are more, the X-Next-Cursor header holds the `cursor` for the next page.
     """
-    query = select(Document).where(Document.user_id == current_user.id)
-    result = await session.exec(query)
-    documents = result.all()
-    return documents
+    # Keyset pagination on (created_at, id): every page is an index range scan,
+    # however deep, and uploads arriving meanwhile never shift the pages
+    query = (
+        select(*SUMMARY_COLUMNS)
+        .where(Document.user_id == current_user.id)
+        .order_by(Document.created_at.desc(), Document.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.where(tuple_(Document.created_at, Document.id) < tuple_(*_decode_cursor(cursor)))
+
+    rows = (await session.exec(query)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [DocumentSummary(**row._mapping) for row in rows]
 
 
-@app.get("/documents/{doc_id}")
-async def get_document(doc_id: uuid.UUID, session: AsyncSession = Depends(get_session)):
-    doc = await session.get(Document, doc_id)
-    return doc
+@app.get("/documents/{doc_id}", response_model=DocumentSummary)
+async def get_document(
+    doc_id: uuid.UUID,
+    current_user: User = Depends(get_reader),
+    session: AsyncSession = Depends(get_session)
+):
+    row = (await session.exec(
+        select(*SUMMARY_COLUMNS).where(Document.id == doc_id, Document.user_id == current_user.id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return DocumentSummary(**row._mapping)
+
+
+@app.get("/documents/{doc_id}/text")
+async def get_document_text(
+    doc_id: uuid.UUID,
+    current_user: User = Depends(get_reader),
+    session: AsyncSession = Depends(get_session)
+):
+    """The redacted text, only loaded when someone actually opens a document."""
+    row = (await session.exec(
+        select(Document.id, Document.text_content).where(Document.id == doc_id, Document.user_id == current_user.id)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"id": row.id, "text_content": row.text_content or ""}
 
 @app.delete("/documents/{doc_id}")
 async def delete_document(
@@ -346,22 +465,32 @@ async def delete_document(
     session: AsyncSession = Depends(get_session)
 ):
     """
-    Deletes a document from the database AND the local uploads folder.
+    Deletes a document from the database AND its file from storage.
     """
-    # 1. Find the document
-    doc = await session.get(Document, doc_id)
-    
-    # 2. Ensure it belongs to the logged-in user
-    if not doc or doc.user_id != current_user.id:
+    # 1. Find the document (just the columns we need, not its text and vector)
+    #    and ensure it belongs to the logged-in user
+    doc = (await session.exec(
+        select(Document.id, Document.filename, Document.file_path)
+        .where(Document.id == doc_id, Document.user_id == current_user.id)
+    )).first()
+    if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
-    # 3. Delete the physical file from the server
-    if os.path.exists(doc.file_path):
-        os.remove(doc.file_path)
-        
-    # 4. Delete the database record
-    await session.delete(doc)
+    # 2. Delete the database records (chunks and jobs first, they reference the doc)
+    result = await session.exec(select(DocumentChunk.id).where(DocumentChunk.document_id == doc.id))
+    chunk_ids = result.all()
+    await session.exec(delete(DocumentChunk).where(DocumentChunk.document_id == doc.id))
+    await session.exec(delete(ProcessingJob).where(ProcessingJob.document_id == doc.id))
+    await session.exec(delete(Document).where(Document.id == doc.id))
+    version = await bump_corpus_version(session, current_user.id)
     await session.commit()
+    vector_cache.remove(current_user.id, chunk_ids, version)
+
+    # 3. Delete the file last: if this fails the blob is orphaned, never the row
+    try:
+        await get_storage().delete(doc.file_path)
+    except Exception as e:
+        print(f"--- STORAGE: Could not delete {doc.file_path}: {e} ---")
     
     return {"message": f"Document {doc.filename} successfully deleted."}
 
@@ -371,93 +500,65 @@ async def delete_document(
 #     """
 #     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
-def cosine_similarity(vec1, vec2):
-    """
-    Returns a score between 0 (different) and 1 (identical).
-    """
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
-    
-    # Safety Net: Prevent Division by Zero if the API ever fails!
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-        
-    return float(np.dot(vec1, vec2) / (norm1 * norm2))
-
 @app.post("/search/")
 async def search_documents(
     query: str,
-    current_user: User = Depends(get_current_user),
+    limit: int = 10,
+    current_user: User = Depends(get_reader),
     session: AsyncSession = Depends(get_session)
 ):
     """
     Semantic Search: Finds the document most relevant to your question.
     """
-    # 1. Convert User's Question to a Vector
-    query_vector = embedding_engine.generate_embedding(query)
-    
-    # 2. Get All User's Documents
-    # (In production, we would let the DB do this math, but Python is fine for <1000 docs)
-    result = await session.exec(select(Document).where(Document.user_id == current_user.id))
-    docs = result.all()
+    # 1-2. Embed the question and let the DB rank the user's chunks and cut the top-k
+    # (pgvector on Postgres, NumPy fallback elsewhere; repeat questions come from the query cache)
+    # Over-fetch so several hits in one document still leave `limit` documents
+    matches = await search_chunks_by_query(session, current_user.id, query, limit=limit * 3)
     
+    # 3. Keep the best chunk per document (already sorted by highest score)
     results = []
-    for doc in docs:
-        if doc.vector:
-            # 3. Calculate "Closeness" Score
-            score = cosine_similarity(query_vector, doc.vector)
-            if score > 0.01: # Filter out irrelevant noise
-                results.append({
-                    "filename": doc.filename,
-                    "score": float(score),
-                    "preview": doc.text_content[:200] + "..."
-                })
-    
-    # 4. Sort by Highest Score
-    results.sort(key=lambda x: x["score"], reverse=True)
+    seen = set()
+    for m in matches:
+        if m["document_id"] in seen:
+            continue
+        seen.add(m["document_id"])
+        results.append({
+            "filename": m["filename"],
+            "score": m["score"],
+            "preview": m["text"][:200] + "..."
+        })
     
-    return results
+    return results[:limit]
 
 
 @app.post("/chat/")
 async def chat_with_documents(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
+    raw_request: Request,
+    current_user: User = Depends(get_reader),
     session: AsyncSession = Depends(get_session)
 ):
-    # 1. Vector Search
-    query_vector = embedding_engine.generate_embedding(request.query)
-    result = await session.exec(select(Document).where(Document.user_id == current_user.id))
-    docs = result.all()
-    
-    # Calculate Scores
-    scored_docs = []
-    for doc in docs:
-        if doc.vector:
-            score = cosine_similarity(query_vector, doc.vector)
-            if score > 0.01:
-                scored_docs.append({
-                    "filename": doc.filename,
-                    "score": round(score, 4),
-                    "text": doc.text_content
-                })
-    
-    # Sort by Score
-    scored_docs.sort(key=lambda x: x["score"], reverse=True)
-    
-    # 2. Select Top 3
-    top_docs = scored_docs[:3]
-    context_text = "\n\n---\n\n".join([d["text"] for d in top_docs]) if top_docs else ""
-    
-    # 3. Prepare Debug Data (This is what we will show in the UI)
+    # 1-2. Vector Search: the best chunks, ranked and cut by the DB (only their text is loaded),
+    # or straight from the query cache for a question we've just answered
+    matches = await search_chunks_by_query(session, current_user.id, request.query, limit=CHAT_TOP_CHUNKS)
+    top_docs = [
+        {"filename": m["filename"], "score": round(m["score"], 4), "text": m["text"]}
+        for m in matches
+    ]
+
+    # 3. Pack system prompt + history + passages into the token budget
+    prompt = build_prompt(request.query, top_docs, request.history)
+
+    # 4. Prepare Debug Data (This is what we will show in the UI)
     debug_payload = {
-        "context_sent_to_llm": context_text,
-        "vector_matches": [{"filename": d["filename"], "score": d["score"]} for d in top_docs]
+        "context_sent_to_llm": prompt.context,
+        "vector_matches": [{"filename": d["filename"], "score": d["score"]} for d in top_docs],
+        "prompt_tokens": prompt.usage,
     }
     
-    # 4. Return Streaming Response (Passing the debug data!)
+    # 5. Return Streaming Response (Passing the debug data!); stops early if the browser goes away
     return StreamingResponse(
-        chat_engine.generate_streaming_answer(request.query, context_text, request.history, debug_payload),
+        chat_engine.generate_streaming_answer(prompt.messages, debug_payload, raw_request.is_disconnected),
         media_type="application/x-ndjson" # New Line Delimited JSON
     )
 
@@ -474,8 +575,8 @@ async def transcribe_audio(file: UploadFile = File(...)):
         with open(temp_filename, "wb") as buffer:
             buffer.write(await file.read())
 
-        # 3. Send to Groq
-        text = chat_engine.transcribe_audio(temp_filename)
+        # 3. Send to the LLM provider
+        text = await chat_engine.transcribe_audio(temp_filename)
         return {"text": text}
         
     finally:
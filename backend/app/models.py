@@ -2,8 +2,50 @@ from typing import Optional
 from sqlmodel import Field, SQLModel
 import uuid
 from datetime import datetime
-from sqlalchemy import Column
+from sqlalchemy import Column, Float, Index
+from sqlalchemy.types import TypeDecorator
 from sqlmodel import Field, SQLModel, JSON # Import JSON
+from pgvector.sqlalchemy import Vector
+from app.core.config import EMBEDDING_DIM
+
+
+class EmbeddingVector(TypeDecorator):
+    """
+    A real pgvector `vector(n)` column on Postgres, plain JSON everywhere else.
+    The JSON fallback keeps SQLite/test databases working without the extension.
+    """
+    impl = JSON
+    cache_ok = True
+
+    class Comparator(TypeDecorator.Comparator):
+        def cosine_distance(self, other):
+            # Only meaningful on Postgres (pgvector's <=> operator)
+            return self.op("<=>", return_type=Float)(other)
+
+    comparator_factory = Comparator
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        super().__init__()
+        self.dim = dim
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(Vector(self.dim))
+        # A missing vector is SQL NULL, like on Postgres (not the JSON text 'null')
+        return dialect.type_descriptor(JSON(none_as_null=True))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        # Accept lists and NumPy arrays alike
+        return [float(x) for x in value]
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # pgvector hands back a NumPy array; keep the API returning plain lists
+        return [float(x) for x in value]
+
 
 class User(SQLModel, table=True):
     # 'id' is the Primary Key. We use UUIDs because they are unique across distributed systems.
@@ -21,21 +63,91 @@ class User(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     auth_provider: str = Field(default='email')
 
+    # Bumped whenever one of the user's documents gets (re)indexed or deleted,
+    # so per-process caches can tell they are stale
+    corpus_version: int = Field(default=0)
+
 
 class Document(SQLModel, table=True):
+    # Serves the dashboard list: one user's documents, newest first, keyset-paginated
+    __table_args__ = (Index("ix_document_user_created", "user_id", "created_at", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     filename: str
     file_size: int
     content_type: str
     file_path: str
+    # SHA-256 of the uploaded bytes, used to reuse earlier processing of identical files
+    content_hash: Optional[str] = Field(default=None, nullable=True, index=True)
     status: str = Field(default="pending")
-    user_id: uuid.UUID = Field(foreign_key="user.id")
+    # Indexed so per-user searches never scan other users' rows
+    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     text_content: Optional[str] = Field(default=None, nullable=True)
     
     # NEW: Store the 384 numbers here
-    # We use sa_column to tell Postgres "This is a JSON list"
-    vector: Optional[list[float]] = Field(default=None, sa_column=Column(JSON)) 
+    # On Postgres this is a pgvector column, elsewhere it falls back to a JSON list.
+    # Holds the normalized mean of the chunk vectors; retrieval uses DocumentChunk,
+    # so unlike documentchunk.vector this one has no ANN index.
+    vector: Optional[list[float]] = Field(default=None, sa_column=Column(EmbeddingVector(EMBEDDING_DIM)))
 
     risk_score: int = Field(default=0)
-  
\ No newline at end of file
+
+    # Parsing progress while status is "processing" (pages_total is unknown until the file is opened)
+    pages_done: int = Field(default=0)
+    pages_total: Optional[int] = Field(default=None, nullable=True)
+
+
+class DocumentSummary(SQLModel):
+    """
+    What list views need. Selected column by column, so text_content and
+    the vector are never read from the database for a table.
+    """
+    id: uuid.UUID
+    filename: str
+    file_size: int
+    status: str
+    risk_score: int
+    created_at: datetime
+    pages_done: int
+    pages_total: Optional[int] = None
+
+
+class DocumentChunk(SQLModel, table=True):
+    """
+    An overlapping slice of a document's redacted text with its own embedding.
+    Retrieval ranks chunks, so long documents are searchable end to end.
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    document_id: uuid.UUID = Field(foreign_key="document.id", index=True)
+    # Denormalized from the document so per-user search needs no join
+    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
+    chunk_index: int
+    text: str
+    token_count: int = Field(default=0)
+    vector: Optional[list[float]] = Field(default=None, sa_column=Column(EmbeddingVector(EMBEDDING_DIM)))
+
+
+class ProcessingJob(SQLModel, table=True):
+    """
+    A durable "process this upload" work item, consumed by app.worker.
+
+    A worker claims a queued job by taking a lease (locked_by +
+    lease_expires_at) and keeps extending it while it runs. If the worker
+    dies, the lease runs out and the job is picked up again, up to
+    max_attempts.
+    """
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    document_id: uuid.UUID = Field(foreign_key="document.id", index=True)
+    file_path: str
+    # queued -> running -> done | failed (running -> queued again on retry)
+    status: str = Field(default="queued", index=True)
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=3)
+    # Earliest time a queued job may run (retry backoff)
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    locked_by: Optional[str] = Field(default=None, nullable=True)
+    lease_expires_at: Optional[datetime] = Field(default=None, nullable=True)
+    last_error: Optional[str] = Field(default=None, nullable=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
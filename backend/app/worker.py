@@ -0,0 +1,136 @@
+"""
+Document processing worker. Pulls ProcessingJobs from the database and runs
+app.pipeline.process_document on them, WORKER_CONCURRENCY at a time.
+
+Run it as its own deployment so API pods and processing scale separately:
+
+    python -m app.worker
+
+With EMBEDDED_WORKER=true (the default) the API also runs one in-process,
+which is handy for docker-compose / local development.
+"""
+import asyncio
+import os
+import signal
+import socket
+import uuid
+from app.core import jobs
+from app.pipeline import process_document
+from app.core.offload import offloader
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "2"))
+# How often an idle slot looks for new jobs (an in-process enqueue wakes it sooner)
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+# How often the orphan sweep runs (expired leases from crashed workers)
+WORKER_RECOVER_SECONDS = float(os.getenv("WORKER_RECOVER_SECONDS", "60"))
+
+
+class Worker:
+    def __init__(self, session_factory, concurrency: int = WORKER_CONCURRENCY):
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        # Unique per process, so leases can be told apart
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    async def run(self, stop: asyncio.Event):
+        print(f"--- WORKER: {self.worker_id} started with {self.concurrency} slots ---")
+        await jobs.recover_orphans(self.session_factory)
+
+        tasks = [asyncio.create_task(self._slot(stop)) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(self._sweeper(stop)))
+        try:
+            await stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            print(f"--- WORKER: {self.worker_id} stopped ---")
+
+    async def _slot(self, stop: asyncio.Event):
+        wakeup = jobs.wakeup_event()
+        while not stop.is_set():
+            try:
+                job = await jobs.claim(self.session_factory, self.worker_id)
+            except Exception as e:
+                print(f"--- WORKER: claim failed: {e} ---")
+                job = None
+
+            if job is None:
+                # Idle: sleep until the next poll or an in-process enqueue
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=WORKER_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._execute(job)
+            except Exception as e:
+                # Never let one job take the slot down with it
+                print(f"--- WORKER: job {job.id} crashed the slot: {type(e).__name__}: {e} ---")
+
+    async def _execute(self, job):
+        print(f"--- WORKER: Running job {job.id} for document {job.document_id} (attempt {job.attempts}) ---")
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        error = None
+        try:
+            await process_document(job.document_id, job.file_path, self.session_factory)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back right away instead of waiting for the lease
+            await asyncio.shield(jobs.release(self.session_factory, job, self.worker_id))
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            heartbeat.cancel()
+
+        # If this bookkeeping fails (e.g. the database blips), the lease expires
+        # and the orphan sweep hands the job out again
+        try:
+            if error is None:
+                await jobs.complete(self.session_factory, job.id, self.worker_id)
+            else:
+                await jobs.fail(self.session_factory, job, self.worker_id, error)
+        except Exception as e:
+            print(f"--- WORKER: could not record the outcome of job {job.id}: {type(e).__name__}: {e} ---")
+
+    async def _heartbeat(self, job):
+        while True:
+            await asyncio.sleep(jobs.JOB_LEASE_SECONDS / 3)
+            try:
+                if not await jobs.heartbeat(self.session_factory, job.id, self.worker_id):
+                    print(f"--- WORKER: Lost the lease on job {job.id} ---")
+                    return
+            except Exception as e:
+                print(f"--- WORKER: heartbeat failed for job {job.id}: {e} ---")
+
+    async def _sweeper(self, stop: asyncio.Event):
+        while not stop.is_set():
+            await asyncio.sleep(WORKER_RECOVER_SECONDS)
+            try:
+                await jobs.recover_orphans(self.session_factory)
+            except Exception as e:
+                print(f"--- WORKER: recovery sweep failed: {e} ---")
+
+
+async def main():
+    from app.db import init_db, async_session
+    from app.core.http import close_http_client
+
+    await init_db()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await Worker(async_session).run(stop)
+    finally:
+        offloader.shutdown()
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
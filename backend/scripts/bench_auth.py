@@ -0,0 +1,86 @@
+"""
+Request latency of an authenticated read endpoint (GET /documents/) with
+the three ways get_current_user can resolve the caller:
+
+    db       every request looks the user up (the old behaviour)
+    cache    short-TTL in-process user cache (AUTH_CACHE_TTL_SECONDS)
+    claims   user id/role trusted from the signed token (AUTH_TRUSTED_CLAIMS)
+
+Runs the app in-process against DATABASE_URL, so point it at the real
+Postgres (Neon) to see the network round trip that is saved. Run from
+the backend folder:
+
+    python -m scripts.bench_auth [--requests 500] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+import httpx
+from sqlalchemy import event
+import app.main as api
+from app.db import engine, init_db
+from app.core.user_cache import user_cache
+
+queries = 0
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count(*args):
+    global queries
+    queries += 1
+
+
+async def run_mode(client, headers, mode: str, requests: int, concurrency: int):
+    global queries
+    user_cache.ttl = 30 if mode == "cache" else 0
+    user_cache.clear()
+    api.AUTH_TRUSTED_CLAIMS = mode == "claims"
+
+    # Warm up (connections, caches)
+    for _ in range(10):
+        (await client.get("/documents/", params={"limit": 20}, headers=headers)).raise_for_status()
+
+    latencies = []
+    queries = 0
+    pending = iter(range(requests))
+
+    async def user():
+        for _ in pending:
+            started = time.perf_counter()
+            (await client.get("/documents/", params={"limit": 20}, headers=headers)).raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{mode:<8}{statistics.median(latencies):>10.2f}{p95:>10.2f}{requests / elapsed:>10.0f}{queries / requests:>12.2f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    await init_db()
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        (await client.post("/users/", json={"email": email, "password_hash": "bench"})).raise_for_status()
+        token = (await client.post("/token", data={"username": email, "password": "bench"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        print(f"{'mode':<8}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}{'queries/req':>12}")
+        for mode in ("db", "cache", "claims"):
+            await run_mode(client, headers, mode, args.requests, args.concurrency)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
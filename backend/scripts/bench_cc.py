@@ -0,0 +1,99 @@
+"""
+Adversarial benchmark for credit card detection. Feeds OCR-style digit
+soup (tables, phone lists, long digit/space runs, runs glued to a letter)
+at growing sizes to the old lazy-quantifier regex and to the Luhn scanner,
+and prints ms per KB. A flat ms/KB column as size grows means the worst
+case is bounded. Run from the backend folder:
+
+    python -m scripts.bench_cc [--repeat 5]
+"""
+import argparse
+import random
+import re
+import time
+from app.core.pii import find_credit_cards
+
+LEGACY_CC_PATTERN = re.compile(r'\b(?:\d[ -]*?){13,16}\b')
+SIZES_KB = [1, 8, 64, 256]
+
+
+def digit_space_run(n: int, rng: random.Random) -> str:
+    # "1 2 3 4 5 ..." with single spaces: every position starts a candidate
+    return " ".join(rng.choice("0123456789") for _ in range(n // 2))
+
+
+def wide_gaps(n: int, rng: random.Random) -> str:
+    # Digits separated by runs of spaces/dashes, ending in a letter so \b fails late
+    parts = []
+    while sum(map(len, parts)) < n:
+        parts.append(rng.choice("0123456789") + rng.choice([" ", "  ", "- ", " -"]) * rng.randint(1, 20))
+    return "".join(parts)[:n - 1] + "x"
+
+
+def ocr_table(n: int, rng: random.Random) -> str:
+    # Columns of 4-digit numbers, the shape that makes 16-digit "cards" out of rows
+    rows = []
+    while sum(map(len, rows)) < n:
+        rows.append("  ".join(f"{rng.randint(0, 9999):04d}" for _ in range(8)) + "\n")
+    return "".join(rows)[:n]
+
+
+def phone_list(n: int, rng: random.Random) -> str:
+    rows = []
+    while sum(map(len, rows)) < n:
+        rows.append(f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d} ")
+    return "".join(rows)[:n]
+
+
+def glued_to_letter(n: int, rng: random.Random) -> str:
+    # Long digit runs followed by a word character: the old \b anchor fails at the very end
+    chunks = []
+    while sum(map(len, chunks)) < n:
+        chunks.append(" ".join(f"{rng.randint(0, 9999):04d}" for _ in range(rng.randint(4, 12))) + "A ")
+    return "".join(chunks)[:n]
+
+
+GENERATORS = {
+    "digit-space run": digit_space_run,
+    "wide separators": wide_gaps,
+    "ocr table": ocr_table,
+    "phone list": phone_list,
+    "digits + letter": glued_to_letter,
+}
+
+
+def legacy_find(text: str):
+    return [m.span() for m in LEGACY_CC_PATTERN.finditer(text)]
+
+
+def ms_per_kb(fn, text: str, repeat: int) -> tuple[float, int]:
+    found = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        found = len(fn(text))
+    elapsed = time.perf_counter() - started
+    return elapsed * 1000 / repeat / (len(text) / 1024), found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'input':<18}{'size':>8}{'legacy ms/KB':>14}{'hits':>7}{'luhn ms/KB':>13}{'hits':>7}")
+    worst = {"legacy": 0.0, "luhn": 0.0}
+    for name, generate in GENERATORS.items():
+        for size_kb in SIZES_KB:
+            text = generate(size_kb * 1024, rng)
+            legacy, legacy_hits = ms_per_kb(legacy_find, text, args.repeat)
+            luhn, luhn_hits = ms_per_kb(find_credit_cards, text, args.repeat)
+            worst["legacy"] = max(worst["legacy"], legacy)
+            worst["luhn"] = max(worst["luhn"], luhn)
+            print(f"{name:<18}{size_kb:>6}KB{legacy:>14.3f}{legacy_hits:>7}{luhn:>13.3f}{luhn_hits:>7}")
+
+    print(f"\nworst case: legacy {worst['legacy']:.3f} ms/KB, luhn scanner {worst['luhn']:.3f} ms/KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Microbenchmark for the regex PII layer on the synthetic_docs corpus.
+Compares the old per-pattern findall + sub passes (with list-based span
+splicing) against the single-pass PIIDetector. Run from the backend folder:
+
+    python -m scripts.bench_pii [--repeat 20]
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from app.core.pii import Span, default_detector, resolve_overlaps, apply_spans
+
+CORPUS_DIR = "synthetic_docs"
+
+
+def legacy_redact(text: str, ner_spans):
+    """The pre-PIIDetector implementation from ner.py, minus the HTTP call."""
+    stats = {"SSN": 0, "CREDIT_CARD": 0, "EMAIL": 0, "URL": 0}
+
+    spans_to_redact = sorted(ner_spans, key=lambda x: x[0], reverse=True)
+    redacted_text = list(text)
+    for start, end, label in spans_to_redact:
+        redacted_text[start:end] = f"<{label}>"
+    final_text = "".join(redacted_text)
+
+    email_pattern = r'[a-zA-Z0-9._%+-]+\s*@\s*[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+    stats["EMAIL"] += len(re.findall(email_pattern, final_text))
+    final_text = re.sub(email_pattern, "<EMAIL>", final_text)
+
+    url_pattern = r'(?:https?://)?(?:www\.)?(?:linkedin\.com|github\.com)\S+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}/\S+'
+    stats["URL"] += len(re.findall(url_pattern, final_text))
+    final_text = re.sub(url_pattern, "<URL>", final_text)
+
+    ssn_pattern = r'\b\d{3}-\d{2}-\d{4}\b'
+    cc_pattern = r'\b(?:\d[ -]*?){13,16}\b'
+    stats["SSN"] += len(re.findall(ssn_pattern, final_text))
+    final_text = re.sub(ssn_pattern, "<SSN>", final_text)
+    stats["CREDIT_CARD"] += len(re.findall(cc_pattern, final_text))
+    final_text = re.sub(cc_pattern, "<CREDIT_CARD>", final_text)
+    return final_text, stats
+
+
+def single_pass_redact(text: str, ner_spans):
+    spans = resolve_overlaps([Span(*s) for s in ner_spans] + default_detector.find(text))
+    return apply_spans(text, spans)
+
+
+def fake_ner_spans(text: str):
+    # Stand-in for model output: every capitalized word pair is a "PER"
+    return [(m.start(), m.end(), "PER") for m in re.finditer(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b", text)]
+
+
+def bench(name, fn, docs, repeat):
+    total_bytes = sum(len(text.encode("utf-8")) for text, _ in docs) * repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text, spans in docs:
+            fn(text, spans)
+    elapsed = time.perf_counter() - started
+    mb_per_s = total_bytes / elapsed / 1e6
+    print(f"{name:<12} {elapsed:8.3f}s  {mb_per_s:8.2f} MB/s")
+    return mb_per_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(CORPUS_DIR, "*.txt")))
+    docs = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        docs.append((text, fake_ner_spans(text)))
+
+    size = sum(len(text) for text, _ in docs)
+    print(f"--- BENCH: {len(docs)} docs, {size / 1e3:.1f} KB, x{args.repeat} ---")
+    before = bench("legacy", legacy_redact, docs, args.repeat)
+    after = bench("single-pass", single_pass_redact, docs, args.repeat)
+    print(f"--- BENCH: speedup {after / before:.2f}x ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -28,13 +28,15 @@ def generate_resume():
     Target PII: Name, Email, Phone, Address.
     """
     profile = fake.profile()
+    # Backslashes aren't allowed inside f-string expressions before Python 3.12
+    address = fake.address().replace('\n', ', ')
     return f"""
     RESUME
     --------------------------------
     Name: {fake.name()}
     Email: {fake.email()}
     Phone: {fake.phone_number()}
-    Address: {fake.address().replace('\n', ', ')}
+    Address: {address}
     
     EXPERIENCE
     --------------------------------
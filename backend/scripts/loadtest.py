@@ -0,0 +1,448 @@
+"""
+End-to-end load test: uploads a generated corpus, waits for the pipeline,
+then drives a concurrent mix of /documents/, /search/ and /chat/. Prints a
+summary and writes a JSON report with p50/p95/p99 latency and throughput per
+endpoint, ingest latency (upload -> completed) and per-stage pipeline
+timings (from the API's /metrics).
+
+By default the whole stack is started locally as subprocesses: the mock HF
+server (NER + embeddings), the mock LLM server and the API itself (uvicorn,
+embedded worker, a fresh SQLite database and upload folder). Nothing leaves
+the machine and no quota is used. Run from the backend folder:
+
+    python -m scripts.loadtest --docs 50 --types txt,docx,pdf --concurrency 8 --out before.json
+    # ... change something ...
+    python -m scripts.loadtest --docs 50 --types txt,docx,pdf --concurrency 8 --out after.json --compare before.json
+
+--base-url http://host:8000 targets an API that is already running instead
+(how it reaches HF and the LLM is then up to its own environment).
+--database-url runs the local API against e.g. Postgres instead of SQLite.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from scripts.make_corpus import make_corpus
+
+QUERIES = [
+    "what is the invoice total",
+    "which patient has a diagnosis",
+    "list the credit card payment details",
+    "who studied computer science",
+    "what is the insurance policy number",
+    "show the billing address",
+    "which documents mention a social security number",
+    "what job experience is listed",
+]
+CONTENT_TYPES = {
+    ".txt": "text/plain",
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+# Server-side histograms worth reporting (sum/count deltas over the run)
+SERVER_METRICS = {
+    "pipeline_stage_seconds": "stage",
+    "pipeline_document_seconds": "status",
+    "offload_queue_wait_seconds": "task",
+    "chat_time_to_first_token_seconds": None,
+    "db_pool_wait_seconds": None,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest-rank, so p99 of 100 samples is the 99th, not an interpolation
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies: list[float], errors: int, wall_seconds: float) -> dict:
+    values = sorted(latencies)
+    summary = {"count": len(values), "errors": errors}
+    if values:
+        summary.update(
+            p50_ms=round(percentile(values, 50) * 1000, 2),
+            p95_ms=round(percentile(values, 95) * 1000, 2),
+            p99_ms=round(percentile(values, 99) * 1000, 2),
+            mean_ms=round(sum(values) / len(values) * 1000, 2),
+            max_ms=round(values[-1] * 1000, 2),
+        )
+    if wall_seconds > 0:
+        summary["throughput_rps"] = round(len(values) / wall_seconds, 2)
+    return summary
+
+
+class LocalStack:
+    """Mock HF + mock LLM + the API, each a subprocess logging to the run folder."""
+
+    def __init__(self, args, workdir: str):
+        self.args = args
+        self.workdir = workdir
+        self.processes = []
+        self.logs = []
+
+    def _start(self, name: str, argv: list[str], env: dict):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.logs.append(log)
+        self.processes.append(subprocess.Popen(
+            [sys.executable, *argv], env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT,
+        ))
+
+    async def start(self) -> str:
+        args = self.args
+        hf_port, llm_port, api_port = free_port(), free_port(), free_port()
+        self._start("mock_hf", [
+            "-m", "scripts.mock_hf_server", "--port", str(hf_port),
+            "--ner-latency-ms", str(args.hf_latency_ms), "--embed-latency-ms", str(args.hf_latency_ms / 2),
+        ], {})
+        self._start("mock_llm", [
+            "-m", "scripts.mock_llm_server", "--port", str(llm_port),
+            "--latency-ms", str(args.llm_latency_ms), "--tokens-per-second", str(args.llm_tokens_per_second),
+        ], {})
+        self._start("api", ["-m", "uvicorn", "app.main:app", "--port", str(api_port), "--log-level", "warning"], {
+            "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{os.path.join(self.workdir, 'loadtest.db')}",
+            "STORAGE_BACKEND": "local",
+            "STORAGE_LOCAL_ROOT": self.workdir,
+            "EMBEDDED_WORKER": "true",
+            "EMBEDDING_BACKEND": "remote",
+            "HF_TOKEN": "loadtest",
+            "HF_INFERENCE_URL": f"http://127.0.0.1:{hf_port}",
+            "LLM_PROVIDER": "openai",
+            "LLM_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+            "GROQ_API_KEY": "unused",
+        })
+
+        base_url = f"http://127.0.0.1:{api_port}"
+        async with httpx.AsyncClient() as client:
+            for port in (hf_port, llm_port, api_port):
+                await self._wait_for(client, f"http://127.0.0.1:{port}/docs")
+        return base_url
+
+    async def _wait_for(self, client: httpx.AsyncClient, url: str, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if any(p.poll() is not None for p in self.processes):
+                raise RuntimeError(f"A service exited during startup, see the logs in {self.workdir}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for log in self.logs:
+            log.close()
+
+
+async def scrape_metrics(client: httpx.AsyncClient) -> dict:
+    """{(histogram, label) -> (sum, count)} for SERVER_METRICS."""
+    response = await client.get("/metrics/")
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        if family.name not in SERVER_METRICS:
+            continue
+        label = SERVER_METRICS[family.name]
+        for sample in family.samples:
+            key = (family.name, sample.labels.get(label, "") if label else "")
+            total, count = samples.get(key, (0.0, 0.0))
+            if sample.name.endswith("_sum"):
+                samples[key] = (total + sample.value, count)
+            elif sample.name.endswith("_count"):
+                samples[key] = (total, count + sample.value)
+    return samples
+
+
+def metric_deltas(before: dict, after: dict) -> dict:
+    report = {}
+    for (name, label), (total, count) in sorted(after.items()):
+        old_total, old_count = before.get((name, label), (0.0, 0.0))
+        count -= old_count
+        if count <= 0:
+            continue
+        total -= old_total
+        report.setdefault(name, {})[label or "all"] = {
+            "count": int(count),
+            "total_seconds": round(total, 3),
+            "mean_ms": round(total / count * 1000, 2),
+        }
+    return report
+
+
+async def login(client: httpx.AsyncClient) -> dict:
+    email = f"loadtest-{uuid.uuid4().hex[:8]}@example.com"
+    (await client.post("/users/", json={"email": email, "password_hash": "loadtest"})).raise_for_status()
+    response = await client.post("/token", data={"username": email, "password": "loadtest"})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_ingest(client, headers, documents: list[dict], concurrency: int, timeout: float) -> tuple[dict, dict]:
+    """Uploads everything with `concurrency` clients, then waits for each document to finish processing."""
+    upload_latencies, upload_errors = [], 0
+    started_at: dict[str, float] = {}
+    pending = iter(documents)
+
+    async def uploader():
+        nonlocal upload_errors
+        for document in pending:
+            path = document["path"]
+            with open(path, "rb") as f:
+                body = f.read()
+            files = {"file": (os.path.basename(path), body, CONTENT_TYPES[os.path.splitext(path)[1]])}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/upload/", files=files, headers=headers)
+                response.raise_for_status()
+            except httpx.HTTPError:
+                upload_errors += 1
+                continue
+            upload_latencies.append(time.perf_counter() - started)
+            started_at[response.json()["document_id"]] = started
+
+    phase_started = time.perf_counter()
+    await asyncio.gather(*(uploader() for _ in range(concurrency)))
+    upload_seconds = time.perf_counter() - phase_started
+
+    # Poll the list and note when each document settles. The list is
+    # paginated: follow the cursor header until the last page, like the dashboard
+    finished: dict[str, tuple[float, str]] = {}
+    deadline = time.perf_counter() + timeout
+    while len(finished) < len(started_at) and time.perf_counter() < deadline:
+        cursor = None
+        while True:
+            params = {"limit": 500}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/documents/", params=params, headers=headers)
+            now = time.perf_counter()
+            for doc in response.json():
+                if doc["id"] in started_at and doc["id"] not in finished and doc["status"] in ("completed", "failed"):
+                    finished[doc["id"]] = (now, doc["status"])
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        await asyncio.sleep(0.2)
+    ingest_seconds = time.perf_counter() - phase_started
+
+    statuses = [status for _, status in finished.values()]
+    ingest = {
+        "documents": len(documents),
+        "completed": statuses.count("completed"),
+        "failed": statuses.count("failed"),
+        "timed_out": len(started_at) - len(finished),
+        "seconds": round(ingest_seconds, 2),
+        "docs_per_second": round(len(finished) / ingest_seconds, 2) if ingest_seconds else 0,
+        "latency": summarize([at - started_at[doc_id] for doc_id, (at, _) in finished.items()], 0, 0),
+    }
+    return summarize(upload_latencies, upload_errors, upload_seconds), ingest
+
+
+async def run_reads(client, headers, requests: int, concurrency: int, mix: dict, seed: int) -> dict:
+    """A seeded, shuffled mix of list/search/chat requests, `concurrency` at a time."""
+    rng = random.Random(seed)
+    operations = [op for op, weight in mix.items() for _ in range(weight)]
+    plan = [(rng.choice(operations), rng.choice(QUERIES)) for _ in range(requests)]
+    latencies = {"documents": [], "search": [], "chat": [], "chat_ttft": []}
+    errors = {"documents": 0, "search": 0, "chat": 0}
+    pending = iter(plan)
+
+    async def chat(query: str):
+        started = time.perf_counter()
+        first_token = None
+        payload = {"query": query, "history": []}
+        async with client.stream("POST", "/chat/", json=payload, headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "error":
+                    raise RuntimeError(event["content"])
+                if event["type"] == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+        latencies["chat_ttft"].append(first_token if first_token is not None else time.perf_counter() - started)
+
+    async def user():
+        for op, query in pending:
+            started = time.perf_counter()
+            try:
+                if op == "documents":
+                    (await client.get("/documents/", params={"limit": 50}, headers=headers)).raise_for_status()
+                elif op == "search":
+                    (await client.post("/search/", params={"query": query}, headers=headers)).raise_for_status()
+                else:
+                    await chat(query)
+            except (httpx.HTTPError, RuntimeError):
+                errors[op] += 1
+                continue
+            latencies[op].append(time.perf_counter() - started)
+
+    phase_started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    wall = time.perf_counter() - phase_started
+
+    report = {op: summarize(latencies[op], errors.get(op, 0), wall) for op in latencies}
+    report["all"] = summarize(
+        latencies["documents"] + latencies["search"] + latencies["chat"], sum(errors.values()), wall,
+    )
+    return report
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':<12}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<12}{stats['count']:>7}{stats['errors']:>8}{stats.get('p50_ms', 0):>10.1f}"
+            f"{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}{stats.get('throughput_rps', 0):>9.1f}"
+        )
+    ingest = report["ingest"]
+    latency = ingest["latency"]
+    print(
+        f"\ningest: {ingest['completed']} completed, {ingest['failed']} failed, {ingest['timed_out']} timed out "
+        f"in {ingest['seconds']}s ({ingest['docs_per_second']} docs/s), "
+        f"p50 {latency.get('p50_ms', 0):.0f} ms, p95 {latency.get('p95_ms', 0):.0f} ms"
+    )
+    for stage, stats in report["server"].get("pipeline_stage_seconds", {}).items():
+        print(f"  {stage:<8}{stats['count']:>6} batches{stats['mean_ms']:>10.1f} ms avg{stats['total_seconds']:>9.1f} s total")
+
+
+def compare(baseline: dict, report: dict):
+    """Prints baseline -> current for the headline numbers, with the change in %."""
+    rows = []
+    for name, stats in report["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name, {})
+        for field in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            rows.append((f"{name}.{field}", old.get(field), stats.get(field)))
+    for field in ("docs_per_second",):
+        rows.append((f"ingest.{field}", baseline.get("ingest", {}).get(field), report["ingest"].get(field)))
+    for field in ("p50_ms", "p95_ms"):
+        rows.append((f"ingest.{field}", baseline.get("ingest", {}).get("latency", {}).get(field),
+                     report["ingest"]["latency"].get(field)))
+    for stage, stats in report["server"].get("pipeline_stage_seconds", {}).items():
+        old = baseline.get("server", {}).get("pipeline_stage_seconds", {}).get(stage, {})
+        rows.append((f"stage.{stage}.mean_ms", old.get("mean_ms"), stats["mean_ms"]))
+
+    print(f"\ncompared with {baseline['meta'].get('git_commit')} ({baseline['meta'].get('started_at')})")
+    workload = ("docs", "types", "pages", "seed", "concurrency", "requests", "mix", "base_url",
+                "hf_latency_ms", "llm_latency_ms", "llm_tokens_per_second")
+    changed = [k for k in workload if baseline["meta"]["args"].get(k) != report["meta"]["args"].get(k)]
+    if changed:
+        print(f"warning: the workload differs ({', '.join(changed)}), so the numbers aren't directly comparable")
+    print(f"{'metric':<28}{'before':>12}{'after':>12}{'change':>10}")
+    for metric, old, new in rows:
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{metric:<28}{old:>12.1f}{new:>12.1f}{change:>10}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--types", default="txt,docx,pdf", help="comma-separated mix of txt,docx,pdf,scanned")
+    parser.add_argument("--pages", type=int, default=1, help="template pages per document")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus-dir", default=None, help="default: loadtest_corpus/<docs>-<types>-<pages>-<seed>")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=300, help="read requests after ingest")
+    parser.add_argument("--mix", default="documents=3,search=4,chat=3", help="relative weights of the read requests")
+    parser.add_argument("--ingest-timeout", type=float, default=600)
+    parser.add_argument("--base-url", default=None, help="test a running API instead of starting one")
+    parser.add_argument("--database-url", default=None, help="database for the locally started API (default: fresh SQLite)")
+    parser.add_argument("--hf-latency-ms", type=float, default=80)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=200)
+    parser.add_argument("--out", default="loadtest.json")
+    parser.add_argument("--compare", default=None, help="earlier report to diff against")
+    args = parser.parse_args()
+    started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    types = args.types.split(",")
+    mix = {op: int(weight) for op, weight in (part.split("=") for part in args.mix.split(","))}
+    corpus_dir = args.corpus_dir or os.path.join(
+        "loadtest_corpus", f"{args.docs}-{'_'.join(types)}-{args.pages}-{args.seed}"
+    )
+    documents = make_corpus(corpus_dir, args.docs, types, args.pages, args.seed)
+    print(f"--- LOADTEST: {len(documents)} documents from '{corpus_dir}' ---")
+
+    workdir = tempfile.mkdtemp(prefix="guardrail-loadtest-")
+    stack = None
+    base_url = args.base_url
+    try:
+        if base_url is None:
+            stack = LocalStack(args, workdir)
+            base_url = await stack.start()
+            print(f"--- LOADTEST: local stack up at {base_url} (logs in {workdir}) ---")
+
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            headers = await login(client)
+            metrics_before = await scrape_metrics(client)
+
+            print("--- LOADTEST: ingest ---")
+            upload, ingest = await run_ingest(client, headers, documents, args.concurrency, args.ingest_timeout)
+            print("--- LOADTEST: reads ---")
+            reads = await run_reads(client, headers, args.requests, args.concurrency, mix, args.seed)
+
+            server = metric_deltas(metrics_before, await scrape_metrics(client))
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    report = {
+        "meta": {
+            "started_at": started_at,
+            "git_commit": git_commit(),
+            "target": args.base_url or "local stack",
+            "args": vars(args),
+        },
+        "endpoints": {"upload": upload, **reads},
+        "ingest": ingest,
+        "server": server,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    print(f"\n--- LOADTEST: report written to {args.out} ---")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Builds a reproducible test corpus from the synthetic document templates
+(resumes, invoices, medical records) in any mix of file types:
+
+    txt      plain text
+    docx     Word document
+    pdf      digital PDF (text layer, read by pdfplumber)
+    scanned  image-only PDF (goes through OCR)
+
+The same --seed, --docs, --pages and --types always produce the same files.
+Run from the backend folder:
+
+    python -m scripts.make_corpus --docs 100 --types txt,docx,pdf,scanned [--pages 3] [--out loadtest_corpus]
+"""
+import argparse
+import json
+import os
+import random
+import docx
+from PIL import Image, ImageDraw, ImageFont
+from scripts.generate_synthetic_data import fake, generate_invoice, generate_medical_record, generate_resume
+
+TYPES = ("txt", "docx", "pdf", "scanned")
+TEMPLATES = {"resume": generate_resume, "invoice": generate_invoice, "medical": generate_medical_record}
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path: str, pages: list[str]):
+    """A minimal PDF with one Helvetica text page per entry (no extra dependency needed)."""
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    next_id = 4
+    for text in pages:
+        lines = " ".join(f"({_pdf_escape(line.strip())}) Tj T*" for line in text.strip().splitlines())
+        content = f"BT /F1 10 Tf 13 TL 56 740 Td {lines} ET".encode("latin-1", "replace")
+        page_id, content_id = next_id, next_id + 1
+        next_id += 2
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+        kids.append(page_id)
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in range(1, next_id):
+        offsets[object_id] = len(out)
+        out += f"{object_id} 0 obj\n".encode() + objects[object_id] + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {next_id}\n0000000000 65535 f \n".encode()
+    for object_id in range(1, next_id):
+        out += f"{offsets[object_id]:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_scanned_pdf(path: str, pages: list[str]):
+    """Renders each page to a 150 dpi letter-size image, so there is no text layer to extract."""
+    font = ImageFont.load_default(size=22)
+    images = []
+    for text in pages:
+        image = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(image)
+        y = 120
+        for line in text.strip().splitlines():
+            draw.text((110, y), line.strip(), fill=0, font=font)
+            y += 32
+        images.append(image)
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+
+
+def write_docx(path: str, pages: list[str]):
+    document = docx.Document()
+    for i, text in enumerate(pages):
+        if i:
+            document.add_page_break()
+        for line in text.strip().splitlines():
+            document.add_paragraph(line.strip())
+    document.save(path)
+
+
+def write_txt(path: str, pages: list[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+
+
+WRITERS = {"txt": write_txt, "docx": write_docx, "pdf": write_text_pdf, "scanned": write_scanned_pdf}
+EXTENSIONS = {"txt": ".txt", "docx": ".docx", "pdf": ".pdf", "scanned": ".pdf"}
+
+
+def make_corpus(out_dir: str, docs: int, types: list[str], pages: int = 1, seed: int = 42) -> list[dict]:
+    """
+    Writes the corpus to out_dir (reusing it if an identical one is already
+    there) and returns its manifest: one {"path", "type", "template", "pages"}
+    per document. Types are assigned round-robin so every mix is even.
+    """
+    for doc_type in types:
+        if doc_type not in WRITERS:
+            raise ValueError(f"Unknown document type '{doc_type}', expected one of {list(TYPES)}")
+
+    config = {"docs": docs, "types": types, "pages": pages, "seed": seed}
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            existing = json.load(f)
+        if existing["config"] == config and all(os.path.exists(d["path"]) for d in existing["documents"]):
+            return existing["documents"]
+
+    os.makedirs(out_dir, exist_ok=True)
+    random.seed(seed)
+    fake.seed_instance(seed)
+
+    documents = []
+    for i in range(docs):
+        doc_type = types[i % len(types)]
+        template = random.choice(list(TEMPLATES))
+        texts = [TEMPLATES[template]() for _ in range(pages)]
+        path = os.path.join(out_dir, f"{template}_{i:05d}_{doc_type}{EXTENSIONS[doc_type]}")
+        WRITERS[doc_type](path, texts)
+        documents.append({"path": path, "type": doc_type, "template": template, "pages": pages})
+
+    with open(manifest_path, "w") as f:
+        json.dump({"config": config, "documents": documents}, f, indent=2)
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--types", default="txt", help=f"comma-separated mix of {','.join(TYPES)}")
+    parser.add_argument("--pages", type=int, default=1, help="template pages per document")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="loadtest_corpus")
+    args = parser.parse_args()
+
+    documents = make_corpus(args.out, args.docs, args.types.split(","), args.pages, args.seed)
+    size = sum(os.path.getsize(d["path"]) for d in documents)
+    print(f"--- CORPUS: {len(documents)} documents, {size / 1024:.0f} KB in '{args.out}' ---")
+
+
+if __name__ == "__main__":
+    main()
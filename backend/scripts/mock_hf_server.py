@@ -0,0 +1,69 @@
+"""
+A local stand-in for the Hugging Face Inference endpoints the pipeline
+calls (bert-base-NER and all-MiniLM-L6-v2 feature extraction), for load
+tests that shouldn't depend on HF's rate limits or cold starts.
+
+NER tags capitalized word pairs as PER; embeddings come from the
+deterministic HashingBackend. Each request waits a fixed latency plus a
+per-input cost, so pipeline timings stay in a realistic shape.
+Run from the backend folder:
+
+    python -m scripts.mock_hf_server [--port 8002] [--ner-latency-ms 80] [--embed-latency-ms 40]
+
+and point the backend at it:
+
+    HF_INFERENCE_URL=http://localhost:8002 HF_TOKEN=anything
+"""
+import argparse
+import asyncio
+import re
+import uvicorn
+from fastapi import FastAPI, Request
+from app.core.embedding_backends import HashingBackend
+
+app = FastAPI()
+embedder = HashingBackend()
+settings = {"ner_latency_ms": 80.0, "embed_latency_ms": 40.0, "embed_item_ms": 2.0}
+
+_PERSON_RE = re.compile(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b")
+
+
+@app.post("/models/dslim/bert-base-NER")
+async def ner(request: Request):
+    text = (await request.json())["inputs"]
+    await asyncio.sleep(settings["ner_latency_ms"] / 1000)
+    return [
+        {"entity_group": "PER", "score": 0.99, "word": m.group(), "start": m.start(), "end": m.end()}
+        for m in _PERSON_RE.finditer(text)
+    ]
+
+
+@app.post("/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction")
+async def feature_extraction(request: Request):
+    texts = (await request.json())["inputs"]
+    if isinstance(texts, str):
+        texts = [texts]
+    await asyncio.sleep((settings["embed_latency_ms"] + settings["embed_item_ms"] * len(texts)) / 1000)
+    vectors, _ = await embedder.embed(texts)
+    return vectors.tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--ner-latency-ms", type=float, default=settings["ner_latency_ms"])
+    parser.add_argument("--embed-latency-ms", type=float, default=settings["embed_latency_ms"])
+    parser.add_argument("--embed-item-ms", type=float, default=settings["embed_item_ms"])
+    args = parser.parse_args()
+
+    settings.update(
+        ner_latency_ms=args.ner_latency_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        embed_item_ms=args.embed_item_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+A local OpenAI-compatible LLM server for load testing /chat/ without
+spending Groq quota. Answers come from the deterministic FakeProvider,
+streamed as server-sent events at a configurable latency and rate.
+Run from the backend folder:
+
+    python -m scripts.mock_llm_server [--port 8001] [--latency-ms 300] [--tokens-per-second 200] [--tokens 120]
+
+and point the backend at it:
+
+    LLM_PROVIDER=openai LLM_BASE_URL=http://localhost:8001/v1
+
+(LLM_PROVIDER=fake gives the same answers in-process, without the HTTP hop.)
+"""
+import argparse
+import json
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.core.llm_providers import FakeProvider
+
+app = FastAPI()
+provider = FakeProvider()
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str = "fake"
+    messages: list[dict]
+    temperature: float = 0.2
+    stream: bool = False
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if not request.stream:
+        content = "".join([token async for token in provider.stream_chat(request.messages)])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": request.model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        }
+
+    def event(delta: dict, finish_reason=None) -> str:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": request.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    async def events():
+        yield event({"role": "assistant"})
+        async for token in provider.stream_chat(request.messages):
+            yield event({"content": token})
+        yield event({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-large-v3")):
+    return {"text": await provider.transcribe(file.filename, await file.read())}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=provider.latency_ms)
+    parser.add_argument("--tokens-per-second", type=float, default=provider.tokens_per_second)
+    parser.add_argument("--tokens", type=int, default=provider.tokens)
+    args = parser.parse_args()
+
+    provider.latency_ms = args.latency_ms
+    provider.tokens_per_second = args.tokens_per_second
+    provider.tokens = args.tokens
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
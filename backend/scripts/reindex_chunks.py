@@ -0,0 +1,67 @@
+"""
+Backfills DocumentChunk rows for documents processed before chunk-level
+embeddings existed, and re-embeds documents left with chunks that have no
+vector (an embedding outage, before those failed the job). Run from the
+backend folder:
+
+    python -m scripts.reindex_chunks
+"""
+import asyncio
+from sqlalchemy import delete, exists, or_
+from sqlmodel import select
+from app.db import init_db, async_session
+from app.models import Document, DocumentChunk
+from app.pipeline import embed_chunks
+from app.core.rag import EmbeddingError
+from app.core.search import bump_corpus_version
+
+
+async def main():
+    await init_db()
+
+    async with async_session() as session:
+        # Completed documents with text but no chunks yet, or unsearchable ones
+        query = select(Document.id).where(
+            Document.status == "completed",
+            Document.text_content.is_not(None),
+            or_(
+                ~exists().where(DocumentChunk.document_id == Document.id),
+                exists().where(DocumentChunk.document_id == Document.id, DocumentChunk.vector.is_(None)),
+            ),
+        )
+        doc_ids = (await session.exec(query)).all()
+
+    print(f"--- REINDEX: {len(doc_ids)} documents need chunks ---")
+
+    for doc_id in doc_ids:
+        async with async_session() as session:
+            doc = await session.get(Document, doc_id)
+            try:
+                chunks, chunk_vectors = await embed_chunks(doc.text_content)
+            except EmbeddingError:
+                # Nothing written; the next run picks it up again
+                print(f"--- REINDEX: {doc.filename} skipped, embedding failed ---")
+                continue
+
+            await session.exec(delete(DocumentChunk).where(DocumentChunk.document_id == doc.id))
+            session.add_all([
+                DocumentChunk(
+                    document_id=doc.id,
+                    user_id=doc.user_id,
+                    chunk_index=chunk.index,
+                    text=chunk.text,
+                    token_count=chunk.token_count,
+                    vector=vector,
+                )
+                for chunk, vector in zip(chunks, chunk_vectors)
+            ])
+            # Same transaction as the new chunks, so search caches reload them
+            await bump_corpus_version(session, doc.user_id)
+            await session.commit()
+            print(f"--- REINDEX: {doc.filename} -> {len(chunks)} chunks ---")
+
+    print("--- REINDEX: Done ---")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
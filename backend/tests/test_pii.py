@@ -0,0 +1,69 @@
+import random
+from app.core.pii import find_credit_cards, default_detector, resolve_overlaps, apply_spans
+
+
+def cards(text: str) -> list[str]:
+    return [text[span.start:span.end] for span in find_credit_cards(text)]
+
+
+def test_finds_cards_in_their_usual_formats():
+    assert cards("Credit Card: 4111111111111111") == ["4111111111111111"]
+    assert cards("card 4111 1111 1111 1111 exp 04/32") == ["4111 1111 1111 1111"]
+    assert cards("4111-1111-1111-1111") == ["4111-1111-1111-1111"]
+    assert cards("Amex 3782 822463 10005") == ["3782 822463 10005"]
+    assert cards("4111111111111111 12") == ["4111111111111111"]
+
+
+def test_back_to_back_cards_are_split_at_the_grouping():
+    assert cards("4111 1111 1111 1111 5500 0000 0000 0004") == ["4111 1111 1111 1111", "5500 0000 0000 0004"]
+
+
+def test_short_groups_next_to_a_card_do_not_hide_it():
+    assert cards("4111 1111 1111 1111 12/25") == ["4111 1111 1111 1111"]
+    assert cards("CC 4111 1111 1111 1111 123") == ["4111 1111 1111 1111"]
+    assert cards("Qty 2 4111 1111 1111 1111") == ["4111 1111 1111 1111"]
+    assert cards("4111-1111-1111-1111-12") == ["4111-1111-1111-1111"]
+    assert cards("4111 1111 1111 1111 12 5500 0000 0000 0004") == ["4111 1111 1111 1111", "5500 0000 0000 0004"]
+
+
+def test_a_separator_change_starts_a_new_number():
+    assert cards("ref 12-4111 1111 1111 1111") == ["4111 1111 1111 1111"]
+
+
+def test_numbers_that_fail_luhn_or_are_glued_to_letters_are_not_cards():
+    assert cards("4111 1111 1111 1112") == []
+    assert cards("0000 0000 0000 0000") == []
+    assert cards("order 4111111111111111A") == []
+    assert cards("4111 1111 1111 1111A") == []
+
+
+def test_phone_lists_do_not_match():
+    rng = random.Random(11)
+
+    def phone():
+        return f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}"
+
+    for _ in range(2000):
+        assert cards(f"{phone()} {phone()}") == []
+        assert cards(" ".join(phone().replace("-", " ") for _ in range(3))) == []
+    assert cards(" ".join(phone() for _ in range(500))) == []
+
+
+def test_numeric_tables_do_not_match():
+    rng = random.Random(12)
+    for columns in (5, 6, 7):
+        rows = [" ".join(f"{rng.randint(0, 9999):04d}" for _ in range(columns)) for _ in range(500)]
+        assert cards("\n".join(rows)) == []
+    # OCR column gaps are wider than one space
+    rows = ["  ".join(f"{rng.randint(0, 9999):04d}" for _ in range(8)) for _ in range(500)]
+    assert cards("\n".join(rows)) == []
+    # Mixed widths, like amounts and quantities
+    rows = [" ".join(str(rng.randint(0, 99999)) for _ in range(8)) for _ in range(500)]
+    assert cards("\n".join(rows)) == []
+
+
+def test_quantities_are_left_alone():
+    text = "Qty 1200 3400 5600 7800 9100 2300 4500"
+    redacted, counts = apply_spans(text, resolve_overlaps(default_detector.find(text)))
+    assert redacted == text
+    assert counts.get("CREDIT_CARD", 0) == 0
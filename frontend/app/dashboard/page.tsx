@@ -38,8 +38,15 @@ export default function Dashboard() {
   const fetchDocuments = async () => {
     try {
       // The 'api' client handles the URL and Token automatically
-      const res = await api.get("/documents/");
-      setDocs(res.data);
+      // The list is paginated: keep following the cursor header until the last page
+      const all: Document[] = [];
+      let cursor: string | undefined;
+      do {
+        const res = await api.get("/documents/", { params: { limit: 200, cursor } });
+        all.push(...res.data);
+        cursor = res.headers["x-next-cursor"];
+      } while (cursor);
+      setDocs(all);
     } catch (error) {
       console.error("Error fetching documents:", error);
       // Optional: Redirect to login if 401